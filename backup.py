@@ -0,0 +1,182 @@
+"""Online backups of the expenses database through SQLite's backup API.
+
+A backup copies pages_per_step pages at a time from its own read-only connection,
+so it can run on a background thread while the app keeps writing. With the WAL
+journal (the "fast" pragma profile) the copy holds one read transaction from the
+first step to the last: it sees a single consistent snapshot and writers are not
+blocked. With a rollback journal a reader would block writers, so the lock is only
+held during each step and a write in between restarts the copy; after max_restarts
+restarts it is done again in a single step, holding the lock for that one copy only.
+
+Backups are checked with PRAGMA quick_check, gzipped and kept as
+expenses-YYYYMMDD-HHMMSS-mmm.db.gz in their directory, newest keep files only.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+BACKUP_PREFIX = "expenses-"
+BACKUP_SUFFIX = ".db.gz"
+
+
+class CopyRestarted(Exception):
+    """Raised from the progress callback to stop a copy that keeps restarting."""
+
+
+def copy_database(source_path, target_path, pages_per_step=256, pause=0.0, max_restarts=3):
+    """Copy the database at source_path to a new file at target_path.
+    Returns (pages, steps, restarts); restarts above max_restarts mean the copy
+    was redone in a single step."""
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    state = {"steps": 0, "restarts": 0, "copied": 0}
+
+    def progress(status, remaining, total):
+        state["steps"] += 1
+        copied = total - remaining
+        if copied < state["copied"]:
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise CopyRestarted()
+        state["copied"] = copied
+        if pause:
+            time.sleep(pause)
+
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            # Pin the snapshot: the steps all read the same version of the database
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress, sleep=0.01)
+        except CopyRestarted:
+            source.backup(target, pages=-1, sleep=0.01)
+            state["steps"] += 1
+        source.rollback()
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+        # The copy is a standalone file, whatever journal mode the original uses
+        target.execute("PRAGMA journal_mode = DELETE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        source.close()
+        target.close()
+    if check != "ok":
+        raise sqlite3.DatabaseError(f"Backup copy failed its integrity check: {check}")
+    return pages, state["steps"], state["restarts"]
+
+
+def is_database(path):
+    """Whether the file at path opens and reads as an SQLite database."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        return True
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+
+def list_backups(directory):
+    """The backup files in directory, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)]
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+
+def rotate_backups(directory, keep):
+    """Delete all but the newest keep backups. Returns the deleted paths."""
+    removed = list_backups(directory)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def backup_age(directory):
+    """Seconds since the newest backup in directory was written, or None without backups."""
+    backups = list_backups(directory)
+    if not backups:
+        return None
+    return time.time() - os.path.getmtime(backups[0])
+
+
+def backup_database(source_path, directory, keep=7, pages_per_step=256, pause=0.0, max_restarts=3,
+                    compresslevel=1):
+    """Write a compressed backup of the database into directory and delete all but the
+    newest keep backups; keep=0 keeps them all. gzip level 1 is about three times
+    faster than the default 6 for 10% more bytes. Returns (path, pages, steps, restarts)."""
+    os.makedirs(directory, exist_ok=True)
+    name = BACKUP_PREFIX + datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3] + BACKUP_SUFFIX
+    path = os.path.join(directory, name)
+    copy_path = path[:-len(".gz")] + ".tmp"
+    gzip_path = path + ".tmp"
+    try:
+        pages, steps, restarts = copy_database(source_path, copy_path, pages_per_step, pause, max_restarts)
+        with open(copy_path, "rb") as copy, gzip.open(gzip_path, "wb", compresslevel=compresslevel) as compressed:
+            shutil.copyfileobj(copy, compressed, 1024 * 1024)
+        os.replace(gzip_path, path)
+    finally:
+        for leftover in (copy_path, gzip_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    if keep:
+        rotate_backups(directory, keep)
+    return path, pages, steps, restarts
+
+
+def restore_database(backup_path, target_path):
+    """Replace the database at target_path with the contents of a backup, .gz or plain.
+    The backup is checked first, and is copied in through the backup API so a target
+    in WAL mode stays consistent. A target that does not read as a database is
+    deleted first, since the backup API cannot write into it. Returns the number of
+    pages restored."""
+    directory = os.path.dirname(os.path.abspath(target_path))
+    copy_path = os.path.join(directory, os.path.basename(target_path) + ".restore.tmp")
+    try:
+        opener = gzip.open if backup_path.endswith(".gz") else open
+        with opener(backup_path, "rb") as backup, open(copy_path, "wb") as copy:
+            shutil.copyfileobj(backup, copy, 1024 * 1024)
+        source = sqlite3.connect(copy_path)
+        try:
+            check = source.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"{backup_path} failed its integrity check: {check}")
+            if os.path.exists(target_path) and not is_database(target_path):
+                for path in (target_path, target_path + "-wal", target_path + "-shm", target_path + "-journal"):
+                    if os.path.exists(path):
+                        os.remove(path)
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target)
+                pages = target.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                target.close()
+        finally:
+            source.close()
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    return pages
+
+
+def start_backup(source_path, directory, keep=7, pages_per_step=256, pause=0.0, callback=None):
+    """Run backup_database on a background thread. callback, if given, is called on that
+    thread with (result, error). Returns the started thread."""
+    def run():
+        try:
+            result, error = backup_database(source_path, directory, keep, pages_per_step, pause), None
+        except Exception as e:
+            result, error = None, e
+        if callback:
+            callback(result, error)
+        elif error:
+            print(f"Backup failed: {error}")
+
+    thread = threading.Thread(target=run, name="backup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,88 @@
+"""Compare columnar analytics against fetchall() tuples for category, month and weekday totals.
+
+    python benchmarks/bench_analytics.py --rows 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ExpenseColumns  # noqa: E402
+from database import Database  # noqa: E402
+
+import datagen  # noqa: E402
+
+
+def tuple_rows(conn, user_id):
+    """The current approach: materialize row tuples with fetchall()."""
+    return conn.execute(
+        """SELECT e.date, e.amount, c.name FROM expenses e
+        LEFT JOIN categories c ON c.id = e.category_id WHERE e.user_id = ?""",
+        (user_id,),
+    ).fetchall()
+
+
+def tuple_totals(rows):
+    by_category, by_month, by_weekday = {}, {}, [0.0] * 7
+    for day, amount, category in rows:
+        by_category[category] = by_category.get(category, 0.0) + amount
+        by_month[day[:7]] = by_month.get(day[:7], 0.0) + amount
+        by_weekday[date.fromisoformat(day).weekday()] += amount
+    return by_category, by_month, by_weekday
+
+
+def columnar_totals(columns):
+    return columns.totals_by_category(), columns.totals_by_month(), columns.totals_by_weekday()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def peak_memory(fn, *args):
+    """Peak traced allocation in MB while fn runs."""
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as workdir:
+            db = Database(os.path.join(workdir, "analytics.db"))
+            user_id, = datagen.populate(db, expenses=rows, years=10, notes=False)
+
+            load_rows, tuples = timed(tuple_rows, db.conn, user_id)
+            aggregate_rows, tuple_result = timed(tuple_totals, tuples)
+            del tuples
+            load_columns, columns = timed(ExpenseColumns.load, db.conn, user_id)
+            aggregate_columns, column_result = timed(columnar_totals, columns)
+            tuple_peak = peak_memory(tuple_rows, db.conn, user_id)
+            column_peak = peak_memory(ExpenseColumns.load, db.conn, user_id)
+            db.close()
+
+        for expected, actual in zip(tuple_result[:2], column_result[:2]):
+            assert expected.keys() == actual.keys()
+            assert all(abs(expected[key] - actual[key]) < 1e-6 * max(1, abs(expected[key])) for key in expected)
+
+        print(f"[{rows:,} rows]")
+        print(f"  fetchall + tuples  load {load_rows:7.3f} s   totals {aggregate_rows:7.3f} s   peak {tuple_peak:8.1f} MB")
+        print(f"  columnar           load {load_columns:7.3f} s   totals {aggregate_columns:7.3f} s   peak {column_peak:8.1f} MB"
+              f"   resident {columns.nbytes() / (1024 * 1024):6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
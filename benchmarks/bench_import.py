@@ -0,0 +1,78 @@
+"""Compare bulk CSV import against the per-row add_expense commit path.
+
+    python benchmarks/bench_import.py --rows 20000 --batch-size 500
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+import datagen  # noqa: E402
+
+
+def write_csv(path, rows, seed=42):
+    """Write rows synthetic expenses in the exporter's Date,Amount,Category layout."""
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Date", "Amount", "Category"])
+        for _user_id, day, amount, category, _notes in datagen.expense_rows(None, rows, random.Random(seed)):
+            writer.writerow([day, amount, category])
+
+
+def open_db(path):
+    db = Database(path)
+    db.register_user("bench", "bench")
+    return db, db.login_user("bench", "bench")
+
+
+def bench_per_row(workdir, csv_path):
+    db, user_id = open_db(os.path.join(workdir, "per_row.db"))
+    start = time.perf_counter()
+    with open(csv_path, newline="") as file:
+        reader = csv.reader(file)
+        next(reader)
+        for date_text, amount, category in reader:
+            db.add_expense(user_id, date_text, float(amount), category)
+    elapsed = time.perf_counter() - start
+    db.conn.close()
+    return elapsed
+
+
+def bench_import(workdir, csv_path, batch_size):
+    db, user_id = open_db(os.path.join(workdir, "bulk.db"))
+    start = time.perf_counter()
+    imported, errors = db.import_csv(user_id, csv_path, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    db.conn.close()
+    assert not errors, errors[:5]
+    return elapsed, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "expenses.csv")
+        write_csv(csv_path, args.rows)
+
+        per_row = bench_per_row(workdir, csv_path)
+        bulk, imported = bench_import(workdir, csv_path, args.batch_size)
+
+    print(f"rows:            {imported}")
+    print(f"add_expense:     {per_row:8.3f} s  {args.rows / per_row:12,.0f} rows/s")
+    print(f"import_csv:      {bulk:8.3f} s  {args.rows / bulk:12,.0f} rows/s")
+    print(f"speedup:         {per_row / bulk:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
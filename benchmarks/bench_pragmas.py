@@ -0,0 +1,67 @@
+"""Compare insert and query latency between the SQLite pragma profiles.
+
+    python benchmarks/bench_pragmas.py --inserts 2000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import PRAGMA_PROFILES, Database  # noqa: E402
+
+import datagen  # noqa: E402
+
+
+def timed(calls):
+    """Run each zero-argument callable and return the latencies in milliseconds."""
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    return f"mean {statistics.mean(latencies):7.3f} ms  p95 {p95:7.3f} ms"
+
+
+def bench_profile(workdir, profile, inserts, queries, seed=42):
+    rng = random.Random(seed)
+    db = Database(os.path.join(workdir, f"{profile}.db"), profile=profile)
+    db.register_user("bench", "bench")
+    user_id = db.login_user("bench", "bench")
+
+    rows = list(datagen.expense_rows(user_id, inserts, rng, years=1))
+    insert_latencies = timed(lambda row=row: db.add_expense(*row) for row in rows)
+    # The query cache is cleared before each call so the timings are of SQLite, not a dict lookup
+    page_latencies = timed(lambda: db.cache.clear() or db.get_expenses_page(user_id) for _ in range(queries))
+    budget_latencies = timed(lambda: db.cache.clear() or db.check_budget_exceeded(user_id) for _ in range(queries))
+    db.conn.close()
+    return insert_latencies, page_latencies, budget_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in PRAGMA_PROFILES:
+            inserts, pages, budgets = bench_profile(workdir, profile, args.inserts, args.queries)
+            print(f"[{profile}]")
+            print(f"  add_expense            {summary(inserts)}")
+            print(f"  get_expenses_page      {summary(pages)}")
+            print(f"  check_budget_exceeded  {summary(budgets)}")
+
+
+if __name__ == "__main__":
+    main()
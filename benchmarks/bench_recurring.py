@@ -0,0 +1,69 @@
+"""Time catching up recurring expenses after a long gap, and check it is idempotent.
+
+Creates many weekly, monthly and every-N-days rules that started years ago,
+materializes them in one call, then checks that a second run for the same
+day writes nothing and that each rule produced the expected occurrences.
+
+    python benchmarks/bench_recurring.py --rules 1000 --years 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, next_occurrence  # noqa: E402
+
+TODAY = "2025-03-31"
+RULES = [("weekly", 1), ("weekly", 2), ("monthly", 1), ("monthly", 3), ("days", 10)]
+
+
+def expected_occurrences(start_date, frequency, interval):
+    """Count occurrences up to TODAY the slow way, one date at a time."""
+    day, count = date.fromisoformat(start_date), 0
+    while day.isoformat() <= TODAY:
+        count += 1
+        day = next_occurrence(day, frequency, interval, date.fromisoformat(start_date).day)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    first = date.fromisoformat(TODAY).toordinal() - 365 * args.years
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database(os.path.join(workdir, "recurring.db"))
+        for user in range(10):
+            db.register_user(f"user{user}", "bench")
+
+        expected = 0
+        for rule in range(args.rules):
+            frequency, interval = rng.choice(RULES)
+            start_date = date.fromordinal(first + rng.randrange(60)).isoformat()
+            db.add_recurring_expense(rule % 10 + 1, start_date, 100.0, f"Bill {rule % 25}", frequency, interval)
+            expected += expected_occurrences(start_date, frequency, interval)
+
+        start = time.perf_counter()
+        written = db.materialize_recurring(TODAY)
+        elapsed = time.perf_counter() - start
+        again = db.materialize_recurring(TODAY)
+        stored = db.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        db.close()
+
+    print(f"{args.rules} rules over {args.years} years: {written:,} expenses in {elapsed * 1000:.1f} ms, "
+          f"second run wrote {again}")
+    assert written == expected == stored, (written, expected, stored)
+    assert again == 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Compare FTS5 expense search against a LIKE '%term%' scan.
+
+Fills a scratch database with expenses whose notes are drawn from a
+vocabulary of merchant and item words, then times search_expenses with the
+full-text index and with the LIKE fallback for a few typical queries, and
+fails if any FTS5 search takes longer than TARGET_MS.
+
+LIKE scans newest first and stops at the 100th match, so for words in
+thousands of rows it is about as fast as FTS5. The index pays off for rare
+words, word pairs and words that never occur, where LIKE scans every row.
+
+    python benchmarks/bench_search.py --rows 500000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+import datagen  # noqa: E402
+
+# Common category, common prefixes, a rare word pair and a word that never occurs
+QUERIES = ["rent", "kari", "bel mo", "zupe", "gorna tashi", "xylophone"]
+TARGET_MS = 10
+
+
+def median_ms(fn, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500000)
+    args = parser.parse_args()
+
+    slow = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        db = Database(os.path.join(workdir, "search.db"))
+        if not db.has_search_index:
+            print("This SQLite build has no FTS5; only the LIKE fallback is available.")
+            return 1
+        user_id, = datagen.populate(db, expenses=args.rows, years=10)
+
+        print(f"[{args.rows:,} rows]  median of 5 runs, first 100 matches")
+        for query in QUERIES:
+            fts_ms, found = median_ms(db.search_expenses, user_id, query)
+            terms = query.split()
+            like_ms, _ = median_ms(db.search_expenses_like, user_id, terms, 100, repeat=1)
+            slow += fts_ms > TARGET_MS
+            print(f"  {query!r:16} fts5 {fts_ms:8.2f} ms   like {like_ms:8.2f} ms   {len(found):3d} rows")
+        db.close()
+
+    if slow:
+        print(f"{slow} queries took longer than {TARGET_MS} ms with FTS5")
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
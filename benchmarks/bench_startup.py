@@ -0,0 +1,55 @@
+"""Measure cold import time and peak RSS of the app module.
+
+Each sample runs in a fresh interpreter. 'eager matplotlib' adds the
+matplotlib.pyplot import that main.py used to do at module level, so the
+two rows compare startup before and after deferring it.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+{extra}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+SCENARIOS = {
+    "lazy matplotlib": "",
+    "eager matplotlib": "import matplotlib.pyplot",
+}
+
+
+def sample(extra):
+    env = dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(extra=extra)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, extra in SCENARIOS.items():
+        samples = [sample(extra) for _ in range(args.runs)]
+        seconds = statistics.median(s["seconds"] for s in samples)
+        rss_mb = statistics.median(s["max_rss_kb"] for s in samples) / 1024
+        print(f"{name:18} import {seconds * 1000:8.1f} ms   peak RSS {rss_mb:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Check that online backups are consistent snapshots while the app keeps writing.
+
+For each pragma profile, a database of --rows synthetic expenses is backed up
+--backups times while a writer thread saves numbered expenses through
+add_expense, one transaction each, and a ticker thread stands in for the UI
+loop. Every backup must pass integrity_check, hold exactly the writer's
+expenses 1..n for some n between the count before and after the backup, and
+have expense_totals and expense_periods rollups that add up to its expenses.
+The last backup is restored and compared too. It also prints add_expense and
+ticker latencies with and without a backup running.
+
+    python benchmarks/check_backup.py --rows 200000 --pages 64
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import backup_database, restore_database  # noqa: E402
+from database import Database  # noqa: E402
+from instrumentation import percentile  # noqa: E402
+
+import datagen  # noqa: E402
+
+WRITER_NOTES = "writer "
+
+
+class Writer(threading.Thread):
+    """Saves expense n with amount n and notes 'writer n', n = 1, 2, ..., timing each save."""
+
+    def __init__(self, path, profile, user_id):
+        super().__init__(name="writer", daemon=True)
+        self.path = path
+        self.profile = profile
+        self.user_id = user_id
+        self.written = 0
+        self.timings = []
+        self.stop = threading.Event()
+
+    def run(self):
+        db = Database(self.path, self.profile)
+        today = date.today().isoformat()
+        while not self.stop.is_set():
+            number = self.written + 1
+            start = time.perf_counter()
+            db.add_expense(self.user_id, today, float(number), "Fuel", f"{WRITER_NOTES}{number}")
+            self.timings.append((time.perf_counter() - start) * 1000)
+            self.written = number
+        db.close()
+
+
+class Ticker(threading.Thread):
+    """Wakes every millisecond like a UI loop and records how late each wake-up is."""
+
+    def __init__(self):
+        super().__init__(name="ticker", daemon=True)
+        self.timings = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.001)
+            self.timings.append((time.perf_counter() - start) * 1000 - 1)
+
+
+def latencies(timings):
+    """p50 / p95 / max of a list of ms timings."""
+    timings = sorted(timings)
+    if not timings:
+        return "no samples"
+    return f"p50 {percentile(timings, 0.5):6.2f} ms  p95 {percentile(timings, 0.95):6.2f} ms  max {timings[-1]:7.2f} ms"
+
+
+def snapshot_problems(path, low, high):
+    """What is wrong with the database at path as a snapshot taken while the writer
+    went from low to high saved expenses; an empty list if nothing."""
+    problems = []
+    conn = sqlite3.connect(path)
+    check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if check != "ok":
+        problems.append(f"integrity_check: {check}")
+    numbers = sorted(int(notes[len(WRITER_NOTES):]) for (notes,) in conn.execute(
+        "SELECT notes FROM expenses WHERE notes LIKE ?", (WRITER_NOTES + "%",)
+    ))
+    if numbers != list(range(1, len(numbers) + 1)):
+        problems.append(f"writer expenses are not 1..n: {len(numbers)} rows, highest {numbers[-1] if numbers else None}")
+    elif not low <= len(numbers) <= high:
+        problems.append(f"{len(numbers)} writer expenses, expected between {low} and {high}")
+    count, total = conn.execute("SELECT COUNT(*), ROUND(SUM(amount), 2) FROM expenses").fetchone()
+    for table in ("expense_totals", "expense_periods"):
+        rollup = conn.execute(f"SELECT SUM(count), ROUND(SUM(total), 2) FROM {table}").fetchone()
+        if rollup != (count, total):
+            problems.append(f"{table} says {rollup}, expenses are {(count, total)}")
+    conn.close()
+    return problems
+
+
+def check_profile(workdir, profile, args):
+    """Back up a database in one pragma profile under concurrent writes; returns the failure count."""
+    path = os.path.join(workdir, f"{profile}.db")
+    db = Database(path, profile)
+    user_id = datagen.populate(db, 1, args.rows, seed=args.seed)[0]
+    db.close()
+    directory = os.path.join(workdir, f"{profile}_backups")
+    print(f"[{profile}: {args.rows:,} expenses, {os.path.getsize(path) / 1024 / 1024:.1f} MiB, "
+          f"{args.pages} pages per step]")
+
+    writer, ticker = Writer(path, profile, user_id), Ticker()
+    writer.start()
+    ticker.start()
+    time.sleep(args.idle)
+    idle_writes, idle_ticks = len(writer.timings), len(ticker.timings)
+
+    failures = 0
+    busy_writes, busy_ticks = [], []
+    for number in range(args.backups):
+        low, writes_before, ticks_before = writer.written, len(writer.timings), len(ticker.timings)
+        start = time.perf_counter()
+        backup_path, pages, steps, restarts = backup_database(
+            path, directory, keep=args.backups, pages_per_step=args.pages, max_restarts=args.max_restarts
+        )
+        elapsed = time.perf_counter() - start
+        high = writer.written
+        busy_writes += writer.timings[writes_before:len(writer.timings)]
+        busy_ticks += ticker.timings[ticks_before:len(ticker.timings)]
+
+        plain_path = os.path.join(workdir, "snapshot.db")
+        restore_database(backup_path, plain_path)
+        problems = snapshot_problems(plain_path, low, high)
+        os.remove(plain_path)
+        fallback = " then one step" if restarts > args.max_restarts else ""
+        print(f"  backup {number + 1}: {elapsed:.2f} s, {pages} pages in {steps} steps, {restarts} restarts{fallback}, "
+              f"{high - low} writes during it{'' if problems else ', consistent'}")
+        for problem in problems:
+            print(f"    {problem}")
+        failures += len(problems)
+
+    writer.stop.set()
+    ticker.stop.set()
+    writer.join()
+    ticker.join()
+    print(f"  add_expense without backup  {latencies(writer.timings[:idle_writes])}")
+    print(f"  add_expense during backups  {latencies(busy_writes)}")
+    print(f"  ticker without backup       {latencies(ticker.timings[:idle_ticks])}")
+    print(f"  ticker during backups       {latencies(busy_ticks)}")
+
+    # Restoring over the live file brings back exactly the last backup
+    restore_database(backup_path, path)
+    restored = Database(path, profile)
+    problems = snapshot_problems(path, 0, writer.written)
+    restored.close()
+    if problems:
+        print(f"  restore: {'; '.join(problems)}")
+    failures += len(problems)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--pages", type=int, default=64, help="pages copied per backup step")
+    parser.add_argument("--backups", type=int, default=3, help="backups per profile")
+    parser.add_argument("--max-restarts", type=int, default=3)
+    parser.add_argument("--idle", type=float, default=1.0, help="seconds of writes timed before the backups")
+    parser.add_argument("--profiles", nargs="+", default=["fast", "default"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in args.profiles:
+            failures += check_profile(workdir, profile, args)
+    print("all backups consistent" if not failures else f"{failures} problems")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
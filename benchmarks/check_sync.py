@@ -0,0 +1,154 @@
+"""Check delta sync between several devices through a loopback sync server.
+
+Device A creates expenses and every device syncs them. Then each device makes
+thousands of random edits and deletions of the same rows, and the devices sync
+in turn. The check fails unless every device ends with exactly the server's
+rows, each row being the newest version (by updated_at, then device id) of
+all the conflicting edits. It also prints how many bytes each phase moved.
+
+    python benchmarks/check_sync.py --rows 2000 --edits 3000 --devices 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from sync import SyncClient, database_caller  # noqa: E402
+from sync_server import make_server  # noqa: E402
+
+import datagen  # noqa: E402
+
+
+def rows_by_uuid(db, user_id):
+    """The device's live expenses and tombstones as {uuid: version}."""
+    versions = {}
+    for uuid, date, amount, category, notes, updated_at, origin in db.conn.execute(
+        """SELECT e.uuid, e.date, e.amount, c.name, e.notes, e.updated_at, e.origin FROM expenses e
+        LEFT JOIN categories c ON c.id = e.category_id WHERE e.user_id = ?""",
+        (user_id,),
+    ):
+        versions[uuid] = (updated_at, origin or db.device_id, (date, amount, category, notes))
+    for uuid, deleted_at, origin in db.conn.execute(
+        "SELECT uuid, deleted_at, origin FROM tombstones WHERE user_id = ?", (user_id,)
+    ):
+        versions[uuid] = (deleted_at, origin or db.device_id, None)
+    return versions
+
+
+def random_edits(db, user_id, rng, count):
+    """Update, re-categorize or delete random rows of the device, one statement each."""
+    ids = [row[0] for row in db.conn.execute("SELECT id FROM expenses WHERE user_id = ?", (user_id,))]
+    for _ in range(count):
+        expense_id = rng.choice(ids)
+        action = rng.random()
+        if action < 0.1:
+            db.delete_expense(expense_id)
+            ids.remove(expense_id)
+        elif action < 0.6:
+            db.conn.execute("UPDATE expenses SET amount = ? WHERE id = ?", (rng.randint(1, 9999), expense_id))
+        else:
+            db.conn.execute(
+                "UPDATE expenses SET category_id = ?, notes = ? WHERE id = ?",
+                (db.get_category_id(user_id, rng.choice(datagen.CATEGORIES)), f"edit {rng.random():.6f}", expense_id),
+            )
+        db.conn.commit()
+        if rng.random() < 0.02:
+            # Let the clock move on so edits on different devices interleave in time
+            time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--edits", type=int, default=3000, help="edits per device")
+    parser.add_argument("--devices", type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = make_server("127.0.0.1", 0, os.path.join(workdir, "server.db"))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+
+        devices = []
+        for number in range(args.devices):
+            db = Database(os.path.join(workdir, f"device{number}.db"))
+            db.register_user("ravi", "secret")
+            db.user_id = db.login_user("ravi", "secret")
+            db.device_id = db.get_sync_state(db.user_id, url)[1]
+            db.client = SyncClient(url, database_caller(db))
+            devices.append(db)
+
+        first = devices[0]
+        first.insert_expenses(list(datagen.expense_rows(first.user_id, args.rows, rng, years=1)))
+        start = time.perf_counter()
+        for db in devices:
+            db.client.sync(db.user_id)
+        sent = sum(db.client.bytes_sent + db.client.bytes_received for db in devices)
+        print(f"initial sync of {args.rows} rows to {args.devices} devices: "
+              f"{time.perf_counter() - start:.2f} s, {sent / 1024:.0f} KiB moved")
+        for db in devices:
+            db.client.bytes_sent = db.client.bytes_received = 0
+
+        # Every device edits the same rows while offline
+        for db in devices:
+            random_edits(db, db.user_id, rng, args.edits)
+        expected = {}
+        for db in devices:
+            for uuid, version in rows_by_uuid(db, db.user_id).items():
+                if uuid not in expected or version[:2] > expected[uuid][:2]:
+                    expected[uuid] = version
+
+        start = time.perf_counter()
+        rounds = [rng.sample(devices, len(devices)) for _ in range(2)]
+        pushed = pulled = 0
+        for order in rounds:
+            for db in order:
+                result = db.client.sync(db.user_id)
+                pushed += result[0]
+                pulled += result[1]
+        sent = sum(db.client.bytes_sent + db.client.bytes_received for db in devices)
+        print(f"{args.edits} conflicting edits per device: two sync rounds in {time.perf_counter() - start:.2f} s, "
+              f"{pushed} changes pushed, {pulled} applied, {sent / 1024:.0f} KiB moved")
+
+        failures = 0
+        for number, db in enumerate(devices):
+            actual = rows_by_uuid(db, db.user_id)
+            wrong = [uuid for uuid in expected if actual.get(uuid, (None, None, "missing"))[2] != expected[uuid][2]]
+            if wrong or actual.keys() != expected.keys():
+                failures += 1
+                print(f"device {number}: {len(wrong)} rows differ from the newest version")
+            rollup, raw = db.conn.execute(
+                "SELECT (SELECT ROUND(SUM(total), 2) FROM expense_totals), (SELECT ROUND(SUM(amount), 2) FROM expenses)"
+            ).fetchone()
+            if rollup != raw:
+                failures += 1
+                print(f"device {number}: expense_totals says {rollup}, expenses add up to {raw}")
+        server_rows = {
+            uuid: (None if deleted else (date, amount, category, notes))
+            for uuid, date, amount, category, notes, deleted in server.store.conn.execute(
+                "SELECT uuid, date, amount, category, notes, deleted FROM changes"
+            )
+        }
+        if server_rows != {uuid: version[2] for uuid, version in expected.items()}:
+            failures += 1
+            print("server rows differ from the newest versions")
+
+        server.shutdown()
+        server.server_close()
+        server.store.close()
+        for db in devices:
+            db.close()
+
+    print("all devices converged" if not failures else f"{failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
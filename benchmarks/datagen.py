@@ -0,0 +1,105 @@
+"""Seeded synthetic expenses for the benchmarks.
+
+populate() registers users bench0, bench1, ... and gives each of them the same
+number of expenses, spread over the given years and over categories with
+realistic frequencies and amounts, written through Database.insert_expenses so
+they land in the current schema with its rollups and search index. The same
+seed always gives the same rows relative to the end date, which defaults to
+today so the current month's budget and totals have data to work on.
+
+    python benchmarks/datagen.py expenses.db --users 3 --expenses 100000
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+# (name, relative frequency, lowest amount, highest amount)
+CATEGORY_PROFILES = [
+    ("Food", 30, 50, 800),
+    ("Groceries", 20, 200, 3000),
+    ("Travel", 8, 100, 5000),
+    ("Shopping", 10, 200, 8000),
+    ("Bills", 6, 500, 5000),
+    ("Rent", 2, 8000, 25000),
+    ("Health", 5, 100, 4000),
+    ("Fun", 8, 100, 2000),
+    ("Fuel", 8, 500, 3000),
+    ("Gifts", 3, 200, 5000),
+]
+CATEGORIES = [profile[0] for profile in CATEGORY_PROFILES]
+SYLLABLES = ["ka", "ri", "mo", "ta", "shi", "na", "bel", "gor", "an", "zu", "pe", "lo"]
+PASSWORD = "bench"
+
+
+def vocabulary(seed=42, size=5000):
+    """Made-up words of two to four syllables, standing in for merchants and items."""
+    rng = random.Random(seed)
+    return sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)})
+
+
+def expense_rows(user_id, count, rng, years=5, until=None, words=None):
+    """Yield count (user_id, date, amount, category, notes) tuples dated within
+    the years up to until. Notes are one to five of words, or empty without them."""
+    last = (until or date.today()).toordinal()
+    span = 365 * years
+    weights = [profile[1] for profile in CATEGORY_PROFILES]
+    for _ in range(count):
+        category, _weight, low, high = rng.choices(CATEGORY_PROFILES, weights)[0]
+        notes = " ".join(rng.choice(words) for _ in range(rng.randint(1, 5))) if words else ""
+        yield (
+            user_id,
+            date.fromordinal(last - rng.randrange(span)).isoformat(),
+            round(rng.uniform(low, high), 2),
+            category,
+            notes,
+        )
+
+
+def populate(db, users=1, expenses=1000, years=5, until=None, notes=True, seed=42, batch_size=50000):
+    """Register users bench0 .. bench{users - 1} and insert expenses rows for each.
+    Returns the user ids in order."""
+    rng = random.Random(seed)
+    words = vocabulary(seed) if notes else None
+    user_ids = []
+    for number in range(users):
+        username = f"bench{number}"
+        db.register_user(username, PASSWORD)
+        user_id = db.get_user_id(username)
+        user_ids.append(user_id)
+        batch = []
+        for row in expense_rows(user_id, expenses, rng, years, until, words):
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.insert_expenses(batch)
+                batch = []
+        if batch:
+            db.insert_expenses(batch)
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a database with seeded synthetic expenses.")
+    parser.add_argument("path", help="database file to create or add to")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--expenses", type=int, default=10000, help="expenses per user")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--until", type=date.fromisoformat, help="last date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--no-notes", dest="notes", action="store_false")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = Database(args.path)
+    user_ids = populate(db, args.users, args.expenses, args.years, args.until, args.notes, args.seed)
+    db.close()
+    print(f"Added {args.expenses:,} expenses for each of users {', '.join(f'bench{n}' for n in range(len(user_ids)))} "
+          f"(password '{PASSWORD}') to {args.path}.")
+
+
+if __name__ == "__main__":
+    main()
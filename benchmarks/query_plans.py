@@ -0,0 +1,64 @@
+"""Check that the hot expense queries are served by an index.
+
+Runs the Database methods used on every screen visit against a scratch
+database, captures the SQL they execute and fails if ``EXPLAIN QUERY PLAN``
+reports a full scan of any table.
+
+    python benchmarks/query_plans.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+def capture_hot_queries(db, user_id):
+    """Run the hot read paths and return the SELECT statements they issued."""
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        db.get_monthly_budget(user_id)
+        db.get_monthly_expense_total(user_id)
+        db.check_budget_exceeded(user_id)
+        db.get_category_totals(user_id)
+        rows, cursor = db.get_expenses_page(user_id, page_size=2)
+        db.get_expenses_page(user_id, page_size=2, cursor=cursor)
+        db.get_expenses_page(user_id, "2024-01-01", "2024-12-31", page_size=2)
+    finally:
+        db.conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def full_scans(db, sql):
+    """Return the plan lines of sql that scan a whole table."""
+    plan = db.conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    details = [row[-1] for row in plan]
+    return [
+        detail for detail in details
+        if detail.startswith("SCAN") and "INDEX" not in detail and "CONSTANT ROW" not in detail
+    ]
+
+
+def main():
+    db = Database(":memory:")
+    db.register_user("bench", "bench")
+    user_id = db.login_user("bench", "bench")
+    for day in range(1, 6):
+        db.add_expense(user_id, f"2024-01-{day:02d}", 10.0 * day, "Food")
+
+    failures = 0
+    for sql in capture_hot_queries(db, user_id):
+        scans = full_scans(db, sql)
+        print(("FULL SCAN " if scans else "ok        ") + " ".join(sql.split()))
+        for detail in scans:
+            print("    " + detail)
+        failures += bool(scans)
+
+    db.conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Run the headless benchmark suite on synthetic databases and save the timings as JSON.
+
+For each size, datagen fills a scratch database with that many expenses for
+each of --users users, then every benchmark times the Database calls behind
+one app action for the first user. The result cache is cleared before each
+run, so the timings are of SQLite rather than of the cache. Compare a run
+against an earlier one, e.g. from another commit, with --compare.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 1000000 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ExpenseColumns  # noqa: E402
+from database import Database  # noqa: E402
+from instrumentation import percentile  # noqa: E402
+
+import datagen  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADD_EXPENSES = 200
+SCROLL_PAGES = 20
+
+
+def add_expense(db, user_id, workdir):
+    """ADD_EXPENSES single-expense saves, each its own transaction, as from the Add screen."""
+    today = date.today().isoformat()
+    for number in range(ADD_EXPENSES):
+        db.add_expense(user_id, today, 100.0 + number, datagen.CATEGORIES[number % len(datagen.CATEGORIES)])
+    return ADD_EXPENSES
+
+
+def month_totals(db, user_id, workdir):
+    """This month's total and per-category totals, as the home screen and summary show."""
+    month = date.today().strftime("%Y-%m")
+    db.get_monthly_expense_total(user_id)
+    return len(db.get_category_totals(user_id, month))
+
+
+def budget_check(db, user_id, workdir):
+    """The budget check made after every saved expense."""
+    db.check_budget_exceeded(user_id)
+    return 1
+
+
+def load_expenses(db, user_id, workdir):
+    """The first page of the View screen."""
+    rows, next_cursor = db.get_expenses_page(user_id)
+    return len(rows)
+
+
+def scroll_expenses(db, user_id, workdir):
+    """SCROLL_PAGES pages of the View screen, as when scrolling down."""
+    count, cursor = 0, None
+    for _ in range(SCROLL_PAGES):
+        rows, cursor = db.get_expenses_page(user_id, cursor=cursor)
+        count += len(rows)
+        if not cursor:
+            break
+    return count
+
+
+def csv_export(db, user_id, workdir):
+    """Export the user's whole history to CSV."""
+    return db.export_csv(user_id, os.path.join(workdir, "export.csv"))
+
+
+def graph_totals(db, user_id, workdir):
+    """All-time category totals, as the Show Graph button plots them."""
+    return len(db.get_category_totals(user_id))
+
+
+def graph_columns(db, user_id, workdir):
+    """Load the history into columns and fold it by category, month and weekday."""
+    columns = ExpenseColumns.load(db.conn, user_id)
+    columns.totals_by_category()
+    columns.totals_by_month()
+    columns.totals_by_weekday()
+    return len(columns)
+
+
+# (name, function, runs); add_expense goes last because it changes the data
+BENCHMARKS = [
+    ("month_totals", month_totals, 20),
+    ("budget_check", budget_check, 20),
+    ("load_expenses", load_expenses, 20),
+    ("scroll_expenses", scroll_expenses, 10),
+    ("graph_totals", graph_totals, 10),
+    ("graph_columns", graph_columns, 3),
+    ("csv_export", csv_export, 3),
+    ("add_expense", add_expense, 3),
+]
+
+
+def measure(fn, runs, *args):
+    """Time runs calls of fn and summarize them; rows is what the last call returned."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "runs": runs,
+        "rows": rows,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "min_ms": round(timings[0], 3),
+    }
+
+
+def run_size(workdir, size, args):
+    """Populate a fresh database with size expenses per user and run every benchmark on it."""
+    path = os.path.join(workdir, f"bench_{size}.db")
+    db = Database(path)
+    start = time.perf_counter()
+    user_ids = datagen.populate(db, args.users, size, args.years, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    user_id = user_ids[0]
+    db.set_monthly_budget(user_id, 50000)
+
+    results = {"populate": {
+        "runs": 1,
+        "rows": size * args.users,
+        "median_ms": round(elapsed * 1000, 3),
+        "rows_per_s": round(size * args.users / elapsed),
+    }}
+    print(f"  {'populate':16} {elapsed:10.3f} s    {results['populate']['rows_per_s']:>10,} rows/s")
+    for name, fn, runs in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+
+        def cold(*fn_args, fn=fn):
+            db.cache.clear()
+            return fn(*fn_args)
+
+        results[name] = measure(cold, runs, db, user_id, workdir)
+        print(f"  {name:16} median {results[name]['median_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms"
+              f"   {results[name]['rows']:>9,} rows")
+    db.close()
+    os.remove(path)
+    return results
+
+
+def git_commit():
+    """The checked-out commit, or None outside a git work tree."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """Print the median of each benchmark in both runs and how it changed."""
+    print(f"\n{'':24}{previous.get('commit') or 'before':>12} {current.get('commit') or 'after':>12}")
+    for size, results in current["results"].items():
+        before = previous["results"].get(size)
+        if not before:
+            continue
+        print(f"[{int(size):,} expenses per user]")
+        for name, result in results.items():
+            if name in before:
+                old, new = before[name]["median_ms"], result["median_ms"]
+                change = f"{new / old:6.2f}x" if old else ""
+                print(f"  {name:20}{old:10.3f} ms {new:10.3f} ms  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="expenses per user for each database")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", choices=[name for name, _fn, _runs in BENCHMARKS],
+                        help="run only these benchmarks (populate always runs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "users": args.users,
+        "years": args.years,
+        "seed": args.seed,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            print(f"[{size:,} expenses x {args.users} users]")
+            report["results"][str(size)] = run_size(workdir, size, args)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import sys
+from collections import OrderedDict
+
+# Returned by ExpenseCache.get when a key is not cached (None is a valid cached value)
+MISSING = object()
+
+
+def estimate_size(value):
+    """Rough memory footprint of a cached query result in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class ExpenseCache:
+    """Per-session LRU cache of Database query results with a memory cap.
+
+    Keys start with the user_id. Each entry carries the data it depends on:
+    'months' (set of 'YYYY-MM'), 'categories' (set of names, or None for all),
+    'span' (lo, hi) dates for expense pages and 'budget'. Writes invalidate only
+    the entries of that user whose dependencies they touch."""
+
+    def __init__(self, max_bytes=2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size, deps)
+        self.user_keys = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, **deps):
+        """Cache value under key, evicting least recently used entries over the cap."""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self.discard(key)
+        self.entries[key] = (value, size, deps)
+        self.user_keys.setdefault(key[0], set()).add(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self.discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def discard(self, key):
+        """Drop one entry if it is cached."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            self.user_keys[key[0]].discard(key)
+
+    def invalidate(self, user_id, dates=(), categories=(), budget=False):
+        """Drop the user's entries that depend on any of the written dates or categories,
+        or on the budget."""
+        months = {date[:7] for date in dates}
+        categories = set(categories)
+        for key in list(self.user_keys.get(user_id, ())):
+            deps = self.entries[key][2]
+            if (budget and deps.get("budget")) or (
+                (dates or categories) and (
+                    months & deps.get("months", set())
+                    or ("categories" in deps and (deps["categories"] is None or categories & deps["categories"]))
+                    or ("span" in deps and any(deps["span"][0] <= date <= deps["span"][1] for date in dates))
+                )
+            ):
+                self.discard(key)
+                self.invalidations += 1
+
+    def clear(self, user_id=None):
+        """Drop every entry, or only those of one user."""
+        keys = list(self.entries) if user_id is None else list(self.user_keys.get(user_id, ()))
+        for key in keys:
+            self.discard(key)
+
+    def stats(self):
+        """Counters for tuning the cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
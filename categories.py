@@ -0,0 +1,46 @@
+from bisect import bisect_left, insort
+
+
+def normalize_category(text):
+    """Display form of a category: surrounding and repeated whitespace removed."""
+    return " ".join(str(text or "").split()) or "Uncategorized"
+
+
+def category_key(text):
+    """Case- and whitespace-insensitive key, so 'Fruits' and 'fruits ' are one category."""
+    return normalize_category(text).casefold()
+
+
+class CategoryIndex:
+    """Sorted in-memory index of category names for prefix autocomplete.
+
+    Keys are kept in a sorted list so a prefix lookup is a bisect to the first
+    match followed by a short scan, independent of the number of categories."""
+
+    def __init__(self, names=()):
+        self.names = {}
+        for name in names:
+            self.names.setdefault(category_key(name), normalize_category(name))
+        self.keys = sorted(self.names)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, name):
+        """Add a category name, ignoring ones already indexed under the same key."""
+        key = category_key(name)
+        if key not in self.names:
+            self.names[key] = normalize_category(name)
+            insort(self.keys, key)
+
+    def suggest(self, prefix, limit=5):
+        """Return up to limit category names starting with prefix, alphabetically."""
+        prefix = " ".join(str(prefix).split()).casefold()
+        if not prefix:
+            return []
+        suggestions = []
+        for key in self.keys[bisect_left(self.keys, prefix):]:
+            if not key.startswith(prefix) or len(suggestions) == limit:
+                break
+            suggestions.append(self.names[key])
+        return suggestions
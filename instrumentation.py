@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def count_rows(result):
+    """Number of rows in a Database call's result: a list of rows, or a (rows, ...) tuple."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    return None
+
+
+def percentile(values, fraction):
+    """The value below which fraction of the sorted values fall."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Instrumentation:
+    """Opt-in recorder of timed operations for finding slow spots on low-end devices.
+
+    Events (database calls, screen builds and entries, slow frames) go into a ring
+    buffer of the last `capacity` events; frame times go into their own ring buffer
+    of the last `frames` frames. Operations slower than slow_ms are also passed to log.
+    Events may be recorded from any thread."""
+
+    def __init__(self, capacity=2000, slow_ms=50.0, frames=600, log=print):
+        self.events = deque(maxlen=capacity)
+        self.frame_times = deque(maxlen=frames)
+        self.slow_ms = slow_ms
+        self.log = log
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, kind, name, ms, **details):
+        """Add one event, e.g. record("db", "get_expenses_page", 3.2, rows=50)."""
+        event = {"time": round(time.time() - self.started, 3), "kind": kind, "name": name, "ms": round(ms, 3)}
+        event.update(details)
+        with self.lock:
+            self.events.append(event)
+        if ms >= self.slow_ms:
+            self.log(f"Slow {kind} {name}: {ms:.1f} ms {details or ''}".rstrip())
+
+    @contextmanager
+    def timed(self, kind, name, **details):
+        """Record how long the body of the with statement takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, (time.perf_counter() - start) * 1000, **details)
+
+    def frame(self, dt):
+        """Record one frame's duration in seconds, as passed to a Clock callback."""
+        ms = dt * 1000
+        with self.lock:
+            self.frame_times.append(ms)
+        if ms >= self.slow_ms:
+            self.record("frame", "slow frame", ms)
+
+    def summary(self):
+        """Per (kind, name) count, mean, p95 and max ms of the buffered events, slowest total first,
+        and the frame time distribution."""
+        with self.lock:
+            events = list(self.events)
+            frame_times = sorted(self.frame_times)
+
+        timings = {}
+        for event in events:
+            timings.setdefault((event["kind"], event["name"]), []).append(event["ms"])
+        operations = []
+        for (kind, name), values in timings.items():
+            values.sort()
+            operations.append({
+                "kind": kind,
+                "name": name,
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p95_ms": percentile(values, 0.95),
+                "max_ms": values[-1],
+                "total_ms": round(sum(values), 3),
+            })
+        operations.sort(key=lambda operation: -operation["total_ms"])
+        frames = {
+            "count": len(frame_times),
+            "p50_ms": round(percentile(frame_times, 0.5), 3),
+            "p95_ms": round(percentile(frame_times, 0.95), 3),
+            "max_ms": round(frame_times[-1], 3) if frame_times else 0.0,
+        }
+        return {"operations": operations, "frames": frames}
+
+    def dump(self, path):
+        """Write the summary and the buffered events to a JSON file."""
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"slow_ms": self.slow_ms, "summary": self.summary(), "events": events}, file, indent=1)
@@ -0,0 +1,296 @@
+"""Command-line entry point to the KharchaBook database, without the Kivy app.
+
+Imports only the storage layer, so scripts and cron jobs start quickly:
+
+    python -m kharchabook add --user NAME 2025-01-31 450 Groceries [--notes TEXT]
+    python -m kharchabook import --user NAME expenses.csv
+    python -m kharchabook export --user NAME out.csv [--from DATE --to DATE] [--gzip]
+    python -m kharchabook summary --user NAME [--month YYYY-MM]
+    python -m kharchabook budget --user NAME [--set AMOUNT [--category NAME] [--period yearly]]
+    python -m kharchabook materialize [--today YYYY-MM-DD]
+    python -m kharchabook recurring add --user NAME DATE AMOUNT CATEGORY [--every weekly --interval 2 --until DATE]
+    python -m kharchabook recurring list|delete --user NAME [ID]
+    python -m kharchabook backup [--dir backups] [--keep 7] [--list]
+    python -m kharchabook restore [--dir backups] BACKUP_FILE
+
+budget exits with status 1 when any budget is exceeded this month or year.
+--db picks the database file and --profile its pragma profile, by default the app's.
+"""
+import argparse
+import configparser
+import math
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from backup import backup_database, list_backups, restore_database
+from database import BUDGET_PERIODS, PRAGMA_PROFILES, RECURRENCE_FREQUENCIES, Database, describe_recurrence
+
+
+def app_profile():
+    """The app's [storage] pragma_profile from kharchabook.ini next to this file, so the CLI
+    does not switch the journal mode of a database the app uses with another profile."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), "kharchabook.ini"))
+    profile = config.get("storage", "pragma_profile", fallback="fast")
+    return profile if profile in PRAGMA_PROFILES else "fast"
+
+
+def iso_date(text):
+    """argparse type for YYYY-MM-DD dates."""
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{text}', use YYYY-MM-DD")
+
+
+def finite_amount(text):
+    """argparse type for amounts: any finite number."""
+    try:
+        value = float(text)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value):
+        raise argparse.ArgumentTypeError(f"invalid amount '{text}'")
+    return value
+
+
+def iso_month(text):
+    """argparse type for YYYY-MM months."""
+    try:
+        return datetime.strptime(text, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month '{text}', use YYYY-MM")
+
+
+def user_id(db, args):
+    """Look up the --user argument, exiting if there is no such user."""
+    found = db.get_user_id(args.user)
+    if found is None:
+        sys.exit(f"Unknown user '{args.user}'")
+    return found
+
+
+def add(db, args):
+    """Add one expense."""
+    db.add_expense(user_id(db, args), args.date, args.amount, args.category, args.notes)
+    print(f"Added ₹{args.amount} for {args.category} on {args.date}.")
+
+
+def import_expenses(db, args):
+    """Bulk import a Date,Amount,Category CSV file."""
+    imported, errors = db.import_csv(user_id(db, args), args.file, batch_size=args.batch_size)
+    for line_number, message in errors:
+        print(f"line {line_number}: {message}", file=sys.stderr)
+    print(f"Imported {imported} expenses, skipped {len(errors)} rows.")
+
+
+def export(db, args):
+    """Export expenses to a CSV file."""
+    if bool(args.start_date) != bool(args.end_date):
+        sys.exit("Give both --from and --to, or neither")
+    written = db.export_csv(user_id(db, args), args.file, args.start_date, args.end_date, compress=args.gzip)
+    print(f"Exported {written} expenses to {args.file}." if written else "No expenses to export.")
+
+
+def summary(db, args):
+    """Print a month's totals per category."""
+    month = args.month or datetime.now().strftime("%Y-%m")
+    totals = sorted(db.get_category_totals(user_id(db, args), month), key=lambda row: -row[1])
+    width = max([len(category) for category, total in totals] + [len("Total")])
+    print(f"Expenses for {month}")
+    for category, total in totals:
+        print(f"  {category:<{width}}  ₹{total:,.2f}")
+    print(f"  {'Total':<{width}}  ₹{sum(total for category, total in totals):,.2f}")
+
+
+def budget(db, args):
+    """Set a budget, then check spending against every budget."""
+    uid = user_id(db, args)
+    if args.set is not None:
+        db.set_budget(uid, args.set, args.category, args.period)
+    status = db.get_budget_status(uid)
+    if not status:
+        print(f"No budget set. Spent ₹{db.get_monthly_expense_total(uid):,.2f} this month.")
+        return 0
+    exceeded = 0
+    for category, period, amount, spent in status:
+        span = "this month" if period == "monthly" else "this year"
+        print(f"{category or 'All expenses'}: spent ₹{spent:,.2f} of ₹{amount:,.2f} {span}.")
+        if spent > amount:
+            exceeded += 1
+            print(f"  Over budget by ₹{spent - amount:,.2f}!")
+    return 1 if exceeded else 0
+
+
+def materialize(db, args):
+    """Write the recurring expenses that are due."""
+    written = db.materialize_recurring(args.today)
+    print(f"Added {written} recurring expenses.")
+
+
+def recurring_add(db, args):
+    """Create a recurring expense and write the occurrences already due."""
+    uid = user_id(db, args)
+    rule_id = db.add_recurring_expense(
+        uid, args.start_date, args.amount, args.category, args.every, args.interval, args.notes, args.until
+    )
+    written = db.materialize_recurring()
+    print(f"Added recurring expense {rule_id}, "
+          f"{describe_recurrence(args.every, args.interval)} from {args.start_date}"
+          f"{f' until {args.until}' if args.until else ''}. Added {written} recurring expenses due by today.")
+
+
+def recurring_list(db, args):
+    """List the user's recurring expenses."""
+    rules = db.get_recurring_expenses(user_id(db, args))
+    if not rules:
+        print("No recurring expenses.")
+    for rule_id, amount, category, notes, frequency, interval, next_date, end_date in rules:
+        until = f" until {end_date}" if end_date else ""
+        ended = end_date and next_date > end_date
+        print(f"{rule_id:>4}  ₹{amount:,.2f} {category} {describe_recurrence(frequency, interval)}{until}, "
+              f"{'ended' if ended else f'next {next_date}'}{f'  ({notes})' if notes else ''}")
+
+
+def recurring_delete(db, args):
+    """Stop a recurring expense; the expenses it already wrote stay."""
+    if not db.delete_recurring_expense(user_id(db, args), args.id):
+        sys.exit(f"No recurring expense {args.id} for user '{args.user}'")
+    print(f"Stopped recurring expense {args.id}.")
+
+
+def backup(db, args):
+    """Write a compressed backup of the database, or list the existing ones."""
+    if args.list:
+        for path in list_backups(args.dir):
+            print(f"{path}  {os.path.getsize(path) / 1024:,.0f} KiB")
+        return
+    if not os.path.isfile(args.db):
+        sys.exit(f"No database file '{args.db}'")
+    try:
+        path, pages, steps, restarts = backup_database(args.db, args.dir, args.keep, args.pages)
+    except sqlite3.DatabaseError as e:
+        sys.exit(f"Not backed up: {e}")
+    print(f"Backed up {pages} pages to {path}.")
+
+
+def restore(db, args):
+    """Replace the database with a backup, after backing up the current contents.
+    A current file that cannot be read is not saved, so a broken database can
+    still be restored."""
+    if not os.path.isfile(args.file):
+        sys.exit(f"No backup file '{args.file}'")
+    saved = None
+    if os.path.isfile(args.db):
+        try:
+            saved = backup_database(args.db, args.dir, keep=0)[0]
+        except sqlite3.DatabaseError as e:
+            print(f"Warning: could not save the current database, restoring over it: {e}", file=sys.stderr)
+    try:
+        pages = restore_database(args.file, args.db)
+    except sqlite3.DatabaseError as e:
+        sys.exit(f"Not restored, the database is unchanged: {e}")
+    if saved:
+        print(f"Saved the current database to {saved}, then restored {pages} pages from {args.file}.")
+    else:
+        print(f"Restored {pages} pages from {args.file}.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="kharchabook", description="KharchaBook database commands.")
+    parser.add_argument("--db", default="expenses.db", help="database file (default: expenses.db)")
+    parser.add_argument("--profile", choices=sorted(PRAGMA_PROFILES), default=app_profile(),
+                        help="pragma profile (default: [storage] pragma_profile in kharchabook.ini, else fast)")
+    # backup and restore work on the file itself: opening a Database would migrate it,
+    # and fail on the broken file restore is there to replace
+    parser.set_defaults(needs_db=True)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("add", help="add an expense")
+    command.add_argument("--user", required=True)
+    command.add_argument("date", type=iso_date)
+    command.add_argument("amount", type=finite_amount)
+    command.add_argument("category")
+    command.add_argument("--notes", default="")
+    command.set_defaults(run=add)
+
+    command = commands.add_parser("import", help="import expenses from a Date,Amount,Category CSV file")
+    command.add_argument("--user", required=True)
+    command.add_argument("file")
+    command.add_argument("--batch-size", type=int, default=500, help="rows per transaction (default: 500)")
+    command.set_defaults(run=import_expenses)
+
+    command = commands.add_parser("export", help="export expenses to a CSV file")
+    command.add_argument("--user", required=True)
+    command.add_argument("file")
+    command.add_argument("--from", dest="start_date", type=iso_date)
+    command.add_argument("--to", dest="end_date", type=iso_date)
+    command.add_argument("--gzip", action="store_true", help="gzip the file")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("summary", help="show a month's totals per category")
+    command.add_argument("--user", required=True)
+    command.add_argument("--month", type=iso_month, help="YYYY-MM (default: this month)")
+    command.set_defaults(run=summary)
+
+    command = commands.add_parser("budget", help="check expenses against the budgets")
+    command.add_argument("--user", required=True)
+    command.add_argument("--set", type=finite_amount, metavar="AMOUNT", help="set a budget first; 0 removes it")
+    command.add_argument("--category", help="budget for this category only (default: all expenses)")
+    command.add_argument("--period", choices=BUDGET_PERIODS, default="monthly")
+    command.set_defaults(run=budget)
+
+    command = commands.add_parser("materialize", help="add the recurring expenses due by today")
+    command.add_argument("--today", type=iso_date, help="catch up to this date instead of today")
+    command.set_defaults(run=materialize)
+
+    command = commands.add_parser("recurring", help="add, list or stop recurring expenses")
+    actions = command.add_subparsers(dest="action", required=True)
+    action = actions.add_parser("add", help="add an expense that repeats from DATE on")
+    action.add_argument("--user", required=True)
+    action.add_argument("start_date", type=iso_date, metavar="date")
+    action.add_argument("amount", type=finite_amount)
+    action.add_argument("category")
+    action.add_argument("--every", choices=RECURRENCE_FREQUENCIES, default="monthly")
+    action.add_argument("--interval", type=int, default=1, help="repeat every N of --every (default: 1)")
+    action.add_argument("--until", type=iso_date, help="last date an occurrence may fall on")
+    action.add_argument("--notes", default="")
+    action.set_defaults(run=recurring_add)
+    action = actions.add_parser("list", help="list recurring expenses")
+    action.add_argument("--user", required=True)
+    action.set_defaults(run=recurring_list)
+    action = actions.add_parser("delete", help="stop a recurring expense, keeping what it wrote")
+    action.add_argument("--user", required=True)
+    action.add_argument("id", type=int)
+    action.set_defaults(run=recurring_delete)
+
+    command = commands.add_parser("backup", help="write a gzipped copy of the database, safe while the app runs")
+    command.add_argument("--dir", default="backups", help="backup directory (default: backups)")
+    command.add_argument("--keep", type=int, default=7, help="newest backups to keep, 0 for all (default: 7)")
+    command.add_argument("--pages", type=int, default=256, help="pages copied per step (default: 256)")
+    command.add_argument("--list", action="store_true", help="list the backups instead, newest first")
+    command.set_defaults(run=backup, needs_db=False)
+
+    command = commands.add_parser("restore", help="replace the database with a backup; close the app first")
+    command.add_argument("--dir", default="backups", help="where to save the current database first")
+    command.add_argument("file", help="backup file, .db.gz or .db")
+    command.set_defaults(run=restore, needs_db=False)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = Database(args.db, args.profile) if args.needs_db else None
+    try:
+        return args.run(db, args) or 0
+    except OSError as e:
+        sys.exit(str(e))
+    finally:
+        if db:
+            db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,62 +1,101 @@
+import time
+STARTED_AT = time.perf_counter()  # taken before the Kivy imports for the startup timing log
+
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
+from kivy.uix.scrollview import ScrollView
 from kivy.uix.image import Image
 from kivy.clock import Clock
+from kivy.logger import Logger
 from kivy.core.audio import SoundLoader
 from kivy.animation import Animation
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.switch import Switch
 from kivy.uix.togglebutton import ToggleButton
-from kivy.properties import BooleanProperty, ListProperty, StringProperty, ObjectProperty
+from kivy.uix.spinner import Spinner
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.widget import Widget
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, Rectangle
+from kivy.properties import BooleanProperty, ListProperty, NumericProperty, StringProperty, ObjectProperty
 from datetime import datetime, timedelta, date
 import calendar
+import math
 import os
 import sys
-import matplotlib.pyplot as plt
-import csv
-import sqlite3
+import threading
+from functools import wraps
+from collections import deque
+from backup import backup_age, start_backup
+from categories import CategoryIndex, category_key, normalize_category
+from database import DatabaseWorker, describe_recurrence, export_csv, shift_date
+from instrumentation import Instrumentation
+
+
+def instrumented(kind):
+    """Time the decorated method with the app's instrumentation when it is enabled."""
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = App.get_running_app().instrumentation
+            if instrumentation is None:
+                return method(self, *args, **kwargs)
+            with instrumentation.timed(kind, f"{type(self).__name__}.{method.__name__}"):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
 
 os.environ['KIVY_AUDIO'] = 'sdl2'
 
 # Date Picker Widget
 class DatePicker(BoxLayout):
-    """Custom Date Picker widget"""
+    """Custom Date Picker widget
+
+    The header, weekday row, six weeks of day buttons and Today button are created
+    once; changing month only relabels and recolors the day buttons. Given
+    load_totals(year, month, callback), which passes (day, total) pairs to callback,
+    each day is shaded by what was spent on it, fetching every month only once."""
     
     selected_date = ObjectProperty(None)
     
-    def __init__(self, callback=None, **kwargs):
+    EMPTY_COLOR = (0, 0, 0, 0)
+    DAY_COLOR = (1, 1, 1, 1)
+    SELECTED_COLOR = (0.3, 0.6, 1, 1)
+    TODAY_COLOR = (0.2, 0.7, 0.3, 1)
+    HEAT_COLOR = (1, 0.4, 0.1, 1)
+    
+    def __init__(self, callback=None, load_totals=None, **kwargs):
         super(DatePicker, self).__init__(**kwargs)
         self.orientation = 'vertical'
         self.callback = callback
+        self.load_totals = load_totals
+        self.month_totals = {}  # (year, month) -> {day: total}, None while it loads
+        # Weeks start on Sunday to match the weekday header
+        self.month_days = calendar.Calendar(calendar.SUNDAY)
         self.current_date = datetime.now()
         self.selected_date = self.current_date
         self.build_layout()
+        self.draw_calendar()
     
     def build_layout(self):
         """Build the date picker UI layout"""
-        self.clear_widgets()
-        
         # Header with month/year and navigation
         header = BoxLayout(orientation='horizontal', size_hint=(1, 0.2))
         prev_month = Button(text='<', size_hint=(0.15, 1))
         prev_month.bind(on_release=self.prev_month)
         
-        month_year = Label(
-            text=self.current_date.strftime('%B %Y'),
-            size_hint=(0.7, 1),
-            bold=True
-        )
+        self.month_label = Label(size_hint=(0.7, 1), bold=True)
         
         next_month = Button(text='>', size_hint=(0.15, 1))
         next_month.bind(on_release=self.next_month)
         
         header.add_widget(prev_month)
-        header.add_widget(month_year)
+        header.add_widget(self.month_label)
         header.add_widget(next_month)
         
         # Days of week header
@@ -64,11 +103,15 @@ class DatePicker(BoxLayout):
         for day in ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']:
             days_header.add_widget(Label(text=day))
         
-        # Calendar grid
+        # Calendar grid: enough cells for any month, relabelled by draw_calendar
         self.calendar_grid = GridLayout(cols=7, size_hint=(1, 0.6))
-        
-        # Draw the calendar
-        self.draw_calendar()
+        self.day_buttons = []
+        for _ in range(6 * 7):
+            btn = Button()
+            btn.day = 0
+            btn.bind(on_release=self.day_released)
+            self.day_buttons.append(btn)
+            self.calendar_grid.add_widget(btn)
         
         # Add to main layout
         self.add_widget(header)
@@ -84,49 +127,58 @@ class DatePicker(BoxLayout):
         self.add_widget(today_btn)
     
     def draw_calendar(self):
-        """Draw the days of the month in the grid"""
-        self.calendar_grid.clear_widgets()
-        
-        # Get the first day of the month and number of days
+        """Show the current month's days in the grid"""
         year = self.current_date.year
         month = self.current_date.month
+        self.month_label.text = self.current_date.strftime('%B %Y')
+        
+        # Day numbers of the selected date and of today if they fall in this month
+        today = date.today()
+        selected_day = self.selected_date.day if (self.selected_date.year, self.selected_date.month) == (year, month) else 0
+        today_day = today.day if (today.year, today.month) == (year, month) else 0
         
-        # Get the calendar for this month
-        cal = calendar.monthcalendar(year, month)
+        totals = None
+        if self.load_totals:
+            key = (year, month)
+            if key not in self.month_totals:
+                self.month_totals[key] = None
+                self.load_totals(year, month, lambda rows: self.totals_loaded(key, rows))
+            totals = self.month_totals[key]
+        peak = max(totals.values()) if totals else 0
         
-        # Fill the calendar grid
-        for week in cal:
-            for day in week:
-                if day == 0:
-                    # Empty day at start/end of month
-                    btn = Button(text='', background_color=(0, 0, 0, 0))
-                    btn.disabled = True
-                else:
-                    # Check if this is the selected date
-                    is_selected = (
-                        self.selected_date.year == year and
-                        self.selected_date.month == month and
-                        self.selected_date.day == day
-                    )
-                    
-                    # Check if this is today
-                    is_today = (
-                        datetime.now().year == year and
-                        datetime.now().month == month and
-                        datetime.now().day == day
-                    )
-                    
-                    # Create the day button
-                    btn = Button(
-                        text=str(day),
-                        background_color=(0.3, 0.6, 1, 1) if is_selected else (0.2, 0.7, 0.3, 1) if is_today else (1, 1, 1, 1)
-                    )
-                    
-                    # Bind the button click
-                    btn.day = day
-                    btn.bind(on_release=lambda btn: self.select_date(btn.day))
-                
-                self.calendar_grid.add_widget(btn)
+        # Zero marks the padding before the 1st and after the last day
+        days = list(self.month_days.itermonthdays(year, month))
+        days += [0] * (len(self.day_buttons) - len(days))
+        for btn, day in zip(self.day_buttons, days):
+            btn.day = day
+            btn.text = str(day) if day else ''
+            btn.disabled = not day
+            if not day:
+                btn.background_color = self.EMPTY_COLOR
+            elif day == selected_day:
+                btn.background_color = self.SELECTED_COLOR
+            elif day == today_day:
+                btn.background_color = self.TODAY_COLOR
+            elif totals and day in totals and peak > 0:
+                btn.background_color = self.heat_color(totals[day] / peak)
+            else:
+                btn.background_color = self.DAY_COLOR
+    
+    def heat_color(self, share):
+        """Blend from the plain day color towards HEAT_COLOR by share of the month's busiest day."""
+        # The square root keeps small days visible next to a large one-off expense
+        share = max(0.0, share) ** 0.5
+        return tuple(plain + (heat - plain) * share for plain, heat in zip(self.DAY_COLOR[:3], self.HEAT_COLOR[:3])) + (1,)
+    
+    def totals_loaded(self, key, rows):
+        """Store a month's (day, total) pairs and recolor the grid if it is still shown."""
+        self.month_totals[key] = dict(rows)
+        if key == (self.current_date.year, self.current_date.month):
+            self.draw_calendar()
+    
+    def day_released(self, btn):
+        if btn.day:
+            self.select_date(btn.day)
     
     def select_date(self, day):
         """Handle date selection"""
@@ -148,7 +200,7 @@ class DatePicker(BoxLayout):
             self.current_date = datetime(self.current_date.year - 1, 12, 1)
         else:
             self.current_date = datetime(self.current_date.year, self.current_date.month - 1, 1)
-        self.build_layout()
+        self.draw_calendar()
     
     def next_month(self, instance):
         """Go to next month"""
@@ -156,137 +208,153 @@ class DatePicker(BoxLayout):
             self.current_date = datetime(self.current_date.year + 1, 1, 1)
         else:
             self.current_date = datetime(self.current_date.year, self.current_date.month + 1, 1)
-        self.build_layout()
+        self.draw_calendar()
+    
+    def reset(self, selected=None):
+        """Show the month of selected (default today) and forget the fetched totals,
+        which may be stale when the picker is opened again."""
+        selected = selected or datetime.now()
+        self.month_totals.clear()
+        self.current_date = datetime(selected.year, selected.month, 1)
+        self.selected_date = selected
+        self.draw_calendar()
     
     def select_today(self, instance):
         """Set date to today"""
         today = datetime.now()
         self.current_date = datetime(today.year, today.month, 1)
         self.selected_date = today
-        self.build_layout()
+        self.draw_calendar()
         
         # Call the callback with today's date
         if self.callback:
             formatted_date = today.strftime("%m/%d/%y")
             self.callback(formatted_date)
 
-# 🎯 --- Database Setup ---
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect("expenses.db")
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        """Create user, expenses, and budget tables."""
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT,
-                email TEXT)"""
-        )
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                date TEXT,
-                amount REAL,
-                category TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id))"""
-        )
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS budget (
-                user_id INTEGER PRIMARY KEY,
-                monthly_budget REAL)"""
-        )
-        self.conn.commit()
+# 📈 Category Chart Widget
+class CategoryChart(Widget):
+    """Horizontal bar chart of (category, total) pairs drawn with canvas instructions."""
 
-    def register_user(self, username, password, email=""):
-        """Register new user."""
-        try:
-            self.cursor.execute(
-                "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
-                (username, password, email),
-            )
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
-
-    def login_user(self, username, password):
-        """Check login credentials."""
-        self.cursor.execute(
-            "SELECT id FROM users WHERE username = ? AND password = ?", (username, password)
-        )
-        user = self.cursor.fetchone()
-        return user[0] if user else None
-
-    def add_expense(self, user_id, date, amount, category):
-        """Add new expense to DB."""
-        self.cursor.execute(
-            "INSERT INTO expenses (user_id, date, amount, category) VALUES (?, ?, ?, ?)",
-            (user_id, date, amount, category),
-        )
-        self.conn.commit()
+    data = ListProperty([])
+    max_bars = NumericProperty(12)
+    bar_color = ListProperty([0.2, 0.7, 0.9, 1])
+    text_color = ListProperty([0.95, 0.95, 0.95, 1])
 
-    def delete_expense(self, expense_id):
-        """Delete an expense from the database."""
-        self.cursor.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
-        self.conn.commit()
-    
-    def set_monthly_budget(self, user_id, budget):
-        """Set monthly budget for a user."""
-        self.cursor.execute(
-            "REPLACE INTO budget (user_id, monthly_budget) VALUES (?, ?)", (user_id, budget)
-        )
-        self.conn.commit()
-
-    def get_monthly_budget(self, user_id):
-        """Retrieve the monthly budget for the user."""
-        self.cursor.execute("SELECT monthly_budget FROM budget WHERE user_id = ?", (user_id,))
-        result = self.cursor.fetchone()
-        return float(result[0]) if result else 0
-
-    def get_monthly_expense_total(self, user_id):
-        """Calculate the total expenses for the current month."""
-        current_month = datetime.now().strftime("%Y-%m")
-        self.cursor.execute(
-            "SELECT SUM(amount) FROM expenses WHERE user_id = ? AND date LIKE ?",
-            (user_id, f"{current_month}%"),
+    def __init__(self, **kwargs):
+        super(CategoryChart, self).__init__(**kwargs)
+        self.bind(pos=self.redraw, size=self.redraw, data=self.redraw)
+        self.redraw()
+
+    def chart_rows(self):
+        """Largest categories first, with the tail folded into 'Other'."""
+        rows = sorted(self.data, key=lambda row: row[1], reverse=True)
+        if len(rows) > self.max_bars:
+            rest = sum(total for _, total in rows[self.max_bars - 1:])
+            rows = rows[:self.max_bars - 1] + [("Other", rest)]
+        return rows
+
+    def redraw(self, *args):
+        """Redraw the bars for the current data and size."""
+        self.canvas.clear()
+        rows = self.chart_rows()
+        if not rows:
+            return
+
+        largest = max(total for _, total in rows) or 1
+        row_height = self.height / len(rows)
+        label_width = self.width * 0.3
+        value_width = self.width * 0.2
+        bar_space = self.width - label_width - value_width
+
+        with self.canvas:
+            for index, (category, total) in enumerate(rows):
+                y = self.top - (index + 1) * row_height
+                bar_height = row_height * 0.7
+                Color(*self.bar_color)
+                Rectangle(
+                    pos=(self.x + label_width, y + (row_height - bar_height) / 2),
+                    size=(max(bar_space * total / largest, 1), bar_height),
+                )
+                self.draw_text(str(category), self.x, y, label_width, row_height)
+                self.draw_text(f"₹{total:.2f}", self.right - value_width, y, value_width, row_height)
+
+    def draw_text(self, text, x, y, width, height):
+        """Draw text centred in a box as a texture rectangle."""
+        label = CoreLabel(text=text, font_size=min(height * 0.45, 32), color=self.text_color,
+                          text_size=(width - 10, None), shorten=True)
+        label.refresh()
+        texture = label.texture
+        Color(1, 1, 1, 1)
+        Rectangle(
+            texture=texture,
+            pos=(x + 5, y + (height - texture.height) / 2),
+            size=texture.size,
         )
-        total = self.cursor.fetchone()[0]
-        return float(total) if total else 0
-
-    def check_budget_exceeded(self, user_id):
-        """Check if the current month expenses exceed the set budget.
-        Returns a tuple (exceeded, budget, expenses) where exceeded is a boolean."""
-        budget = self.get_monthly_budget(user_id)
-        expenses = self.get_monthly_expense_total(user_id)
-        
-        if budget > 0 and expenses > budget:
-            return (True, budget, expenses)
-        return (False, budget, expenses)
 
 
 # --- Welcome Screen ---
 class WelcomeScreen(Screen):
+    """Splash screen shown until the database and the login screen are ready."""
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         layout = BoxLayout(orientation='vertical')
         self.add_widget(layout)
 
-        # Load and play the sound
+        self.shown_at = time.perf_counter()
+        self.database_ready = False
+        self.database_error = None
+        self.login_ready = False
+
+        # Decode the chime off the main thread so it doesn't hold up the first frame
+        threading.Thread(target=self.load_chime, name="welcome-chime", daemon=True).start()
+
+    def load_chime(self):
+        """Load the welcome chime and play it from the main thread."""
         sound = SoundLoader.load("assets/welcome_chime.mp3")
         if sound:
-            sound.play()
+            Clock.schedule_once(lambda dt: sound.play())
         else:
             print("Sound file not found!")
 
-        # Schedule transition to LoginScreen after 5 seconds
-        Clock.schedule_once(self.switch_to_login, 4)
+    def on_database_ready(self, *args):
+        """Called once the database worker has opened and migrated the database."""
+        self.database_ready = True
+        App.get_running_app().mark_startup("database ready")
+        self.switch_when_ready()
+
+    def on_database_failed(self, error):
+        """Called instead when the database cannot be opened or migrated: leave the splash
+        anyway and show why, rather than waiting for a database that will not come."""
+        Logger.error(f"Database: could not open the database: {error}")
+        self.database_error = error
+        self.database_ready = True
+        self.switch_when_ready()
+
+    def on_login_ready(self):
+        """Called once the login screen has been built."""
+        self.login_ready = True
+        App.get_running_app().mark_startup("login screen built")
+        self.switch_when_ready()
+
+    def switch_when_ready(self, *args):
+        """Go to the login screen once everything is ready and the splash was shown long enough."""
+        if not (self.database_ready and self.login_ready) or self.manager.current != "welcome":
+            return
+        app = App.get_running_app()
+        remaining = app.config.getfloat("startup", "splash_min_seconds") - (time.perf_counter() - self.shown_at)
+        if remaining > 0:
+            Clock.schedule_once(self.switch_when_ready, remaining)
+            return
+        self.switch_to_login()
+        app.mark_startup("splash finished")
+        app.log_startup()
+        if self.database_error:
+            self.manager.get_screen("login").show_popup(
+                "Database Error", f"Could not open the database:\n{self.database_error}"
+            )
 
-    def switch_to_login(self, dt):
+    def switch_to_login(self, *args):
         self.manager.current = 'login'
 
 
@@ -300,7 +368,10 @@ class LoginScreen(Screen):
         username = self.ids.username.text
         password = self.ids.password.text
 
-        user_id = self.manager.db.login_user(username, password)
+        self.manager.db.submit("login_user", username, password, callback=self.on_login)
+
+    def on_login(self, user_id):
+        """Open the home screen once the credentials have been checked."""
         if user_id:
             self.manager.current_user_id = user_id
             self.manager.current = "home"
@@ -337,15 +408,14 @@ class LoginScreen(Screen):
             self.show_popup("Error", "Please fill in both fields!")
             return
 
-        # Check if the user exists
-        self.manager.db.cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-        user = self.manager.db.cursor.fetchone()
+        self.manager.db.submit(
+            "reset_password", username, new_password,
+            callback=lambda reset: self.on_password_reset(reset, popup),
+        )
 
-        if user:
-            self.manager.db.cursor.execute(
-                "UPDATE users SET password = ? WHERE username = ?", (new_password, username)
-            )
-            self.manager.db.conn.commit()
+    def on_password_reset(self, reset, popup):
+        """Report whether the password was reset."""
+        if reset:
             popup.dismiss()
             self.show_popup("Success", "Password reset successfully!")
         else:
@@ -383,7 +453,11 @@ class RegisterScreen(Screen):
         username = self.ids.reg_username.text
         password = self.ids.reg_password.text
 
-        if self.manager.db.register_user(username, password):
+        self.manager.db.submit("register_user", username, password, callback=self.on_register)
+
+    def on_register(self, registered):
+        """Report the registration result."""
+        if registered:
             self.manager.current = "login"
             self.show_popup("Success", "User registered successfully!")
         else:
@@ -401,27 +475,46 @@ class RegisterScreen(Screen):
 
 # 🏠 --- Home Screen ---
 class HomeScreen(Screen):
+    syncing = False
+    DEBUG_TAPS = 5
+    title_taps = []
+
+    @instrumented("screen")
     def on_enter(self):
         """Called when the screen is entered, display budget and check if exceeded"""
-        self.display_budget()
         self.check_budget_status()
 
     def check_budget_status(self):
-        """Check if budget is exceeded and show notification if needed"""
+        """Show the budget and any budget alerts not shown before."""
         user_id = self.manager.current_user_id
-        exceeded, budget, expenses = self.manager.db.check_budget_exceeded(user_id)
-        
-        if exceeded:
+        self.manager.db.submit("get_monthly_budget", user_id, callback=self.display_budget)
+        # Alerts are recorded when expenses are written and cached until the next write,
+        # so a repeat visit costs no SQL
+        self.manager.db.submit("get_unseen_alerts", user_id, callback=self.on_budget_alerts)
+
+    def on_budget_alerts(self, alerts):
+        """Show new budget alerts once."""
+        if alerts:
+            self.manager.db.submit("mark_alerts_seen", self.manager.current_user_id, alerts)
             # Show budget alert popup
-            budget_alert = BudgetAlertPopup(budget, expenses)
+            budget_alert = BudgetAlertPopup(alerts)
             Clock.schedule_once(lambda dt: budget_alert.open(), 0.5)
 
-    def display_budget(self):
-        user_id = self.manager.current_user_id
-        budget = self.manager.db.get_monthly_budget(user_id)
+    def display_budget(self, budget):
         budget_text = f"Monthly Budget: ₹{budget}" if budget else "No budget set"
         self.ids.budget_label.text = budget_text
 
+    def title_tapped(self, label, touch):
+        """Open the hidden debug screen after five quick taps on the title."""
+        if not label.collide_point(*touch.pos) or App.get_running_app().instrumentation is None:
+            return
+        now = time.perf_counter()
+        self.title_taps = [tapped for tapped in self.title_taps if now - tapped < 2] + [now]
+        if len(self.title_taps) >= self.DEBUG_TAPS:
+            self.title_taps = []
+            self.manager.transition = SlideTransition(direction='left')
+            self.manager.current = "debug"
+
     def add_expense_screen(self):
         """Navigate to Add Expense screen."""
         self.manager.transition = SlideTransition(direction='left')
@@ -433,31 +526,78 @@ class HomeScreen(Screen):
         self.manager.current = "view_expense"
 
     def set_budget(self):
-        """Popup to set monthly budget."""
-        content = BoxLayout(orientation='vertical')
-        budget_input = TextInput(hint_text="Enter Monthly Budget (₹)")
+        """Popup to set a monthly or yearly budget, for all expenses or one category."""
+        content = BoxLayout(orientation='vertical', spacing=5)
+        budget_input = TextInput(hint_text="Enter Budget (₹), 0 to remove", multiline=False)
+        category_input = TextInput(hint_text="Category (blank for all expenses)", multiline=False)
+        period_spinner = Spinner(text="Monthly", values=["Monthly", "Yearly"], size_hint=(1, 0.2))
         submit_button = Button(text="Set Budget", size_hint=(1, 0.2))
 
         content.add_widget(budget_input)
+        content.add_widget(category_input)
+        content.add_widget(period_spinner)
         content.add_widget(submit_button)
 
-        popup = Popup(title="Set Monthly Budget", content=content, size_hint=(0.8, 0.4))
+        popup = Popup(title="Set Budget", content=content, size_hint=(0.8, 0.5))
 
         submit_button.bind(
-            on_release=lambda *args: self.save_budget(budget_input.text, popup)
+            on_release=lambda *args: self.save_budget(
+                budget_input.text, category_input.text.strip(), period_spinner.text.lower(), popup
+            )
         )
         popup.open()
-        self.display_budget()
 
-    def save_budget(self, budget_input, popup):
-        """Save the monthly budget."""
+    def save_budget(self, budget_input, category, period, popup):
+        """Save the budget; alerts it already triggers show up right away."""
         if budget_input.isdigit():
-            self.manager.db.set_monthly_budget(self.manager.current_user_id, float(budget_input))
-            self.show_popup("Success", f"Monthly budget set to ₹{budget_input}")
+            amount = float(budget_input)
+            self.manager.db.submit(
+                "set_budget", self.manager.current_user_id, amount, category or None, period,
+                callback=lambda result: self.check_budget_status(),
+            )
+            scope = f"{category} " if category else ""
+            if amount:
+                self.show_popup("Success", f"{period.capitalize()} {scope}budget set to ₹{budget_input}")
+            else:
+                self.show_popup("Success", f"{period.capitalize()} {scope}budget removed")
             popup.dismiss()
         else:
             self.show_popup("Error", "Please enter a valid number!")
-        self.display_budget()
+
+    def sync_expenses(self):
+        """Exchange changed expenses with the sync server set in the app config."""
+        url = App.get_running_app().config.get("sync", "url")
+        if not url:
+            self.show_popup("Sync", "Set the sync server url under [sync]\nin kharchabook.ini first.")
+            return
+        if self.syncing:
+            return
+        self.syncing = True
+        # Imported on first use so urllib does not slow down startup
+        from sync import SyncClient
+
+        client = SyncClient(url, self.manager.db.call)
+        threading.Thread(
+            target=self.run_sync, args=(client, self.manager.current_user_id), name="sync", daemon=True
+        ).start()
+
+    def run_sync(self, client, user_id):
+        """Sync on a background thread; the database calls still run on the database worker."""
+        try:
+            result, error = client.sync(user_id), None
+        except Exception as e:
+            result, error = None, e
+        Clock.schedule_once(lambda dt: self.on_sync_finished(result, error))
+
+    def on_sync_finished(self, result, error):
+        """Report the outcome of a sync and refresh the budget."""
+        self.syncing = False
+        if error:
+            self.show_popup("Sync Failed", str(error))
+            return
+        pushed, pulled = result
+        self.show_popup("Sync", f"Sent {pushed} changes, received {pulled}.")
+        self.check_budget_status()
 
     def logout_user(self):
         """Log out and return to Login screen."""
@@ -472,29 +612,105 @@ class HomeScreen(Screen):
 
 # 💸 --- Add Expense Screen ---
 class AddExpenseScreen(Screen):
+    MAX_SUGGESTIONS = 5
+    # Repeat spinner choice -> (frequency, interval); "Every N days" reads N from repeat_days
+    REPEAT_CHOICES = {
+        "Weekly": ("weekly", 1),
+        "Every 2 weeks": ("weekly", 2),
+        "Monthly": ("monthly", 1),
+        "Yearly": ("monthly", 12),
+    }
+
     def __init__(self, **kwargs):
         super(AddExpenseScreen, self).__init__(**kwargs)
+        self.category_index = CategoryIndex()
+        self.index_user_id = None
+        self.suggestion_buttons = []
+        self.date_popup = None
+
+    def load_categories(self):
+        """Fetch the user's categories for autocomplete, once per login."""
+        user_id = self.manager.current_user_id
+        if user_id != self.index_user_id:
+            self.index_user_id = user_id
+            self.category_index = CategoryIndex()
+            self.manager.db.submit("get_categories", user_id, callback=self.on_categories_loaded)
+
+    def on_categories_loaded(self, names):
+        """Build the prefix index from the fetched category names."""
+        self.category_index = CategoryIndex(names)
+
+    def suggest_categories(self, text):
+        """Show the known categories starting with what has been typed so far."""
+        box = self.ids.category_suggestions
+        box.clear_widgets()
+        suggestions = [
+            name for name in self.category_index.suggest(text, self.MAX_SUGGESTIONS)
+            if category_key(name) != category_key(text)
+        ]
+        # The buttons are created once and relabelled on every keystroke
+        while len(self.suggestion_buttons) < len(suggestions):
+            button = Button(on_release=lambda button: self.pick_category(button.text))
+            self.suggestion_buttons.append(button)
+        for button, name in zip(self.suggestion_buttons, suggestions):
+            button.text = name
+            box.add_widget(button)
+
+    def pick_category(self, name):
+        """Fill in a suggested category."""
+        self.ids.category_input.text = name
+        self.ids.category_suggestions.clear_widgets()
         
     def clear_fields(self):
         """Clear all input fields on the Add Expense screen."""
         self.ids.date_input.text = ""
         self.ids.amount_input.text = ""
         self.ids.category_input.text = ""
+        self.ids.notes_input.text = ""
+        self.ids.repeat_spinner.text = "Never"
+        self.ids.repeat_days.text = ""
+
+    def repeat_rule(self):
+        """Return the (frequency, interval) picked in the Repeat spinner, None for a one-off
+        expense. Raises ValueError for an invalid day count."""
+        repeat = self.ids.repeat_spinner.text
+        if repeat == "Never":
+            return None
+        if repeat in self.REPEAT_CHOICES:
+            return self.REPEAT_CHOICES[repeat]
+        days = int(self.ids.repeat_days.text)
+        if days < 1:
+            raise ValueError(days)
+        return ("days", days)
         
     def show_date_picker(self):
         """Display the date picker popup"""
-        # Create content with the DatePicker widget
-        content = DatePicker(callback=self.update_date)
-        
-        # Create popup with the date picker
-        self.date_popup = Popup(
-            title="Select Date",
-            content=content,
-            size_hint=(0.9, 0.9),
-            auto_dismiss=True
-        )
+        # The picker and its popup are built on first use and reused afterwards
+        if self.date_popup is None:
+            load_totals = None
+            if App.get_running_app().config.getboolean("calendar", "heatmap"):
+                load_totals = self.load_daily_totals
+            content = DatePicker(callback=self.update_date, load_totals=load_totals)
+            
+            # Create popup with the date picker
+            self.date_popup = Popup(
+                title="Select Date",
+                content=content,
+                size_hint=(0.9, 0.9),
+                auto_dismiss=True
+            )
+        else:
+            try:
+                selected = datetime.strptime(self.ids.date_input.text, "%m/%d/%y")
+            except ValueError:
+                selected = None
+            self.date_popup.content.reset(selected)
         self.date_popup.open()
     
+    def load_daily_totals(self, year, month, callback):
+        """Fetch a month's spending per day for the date picker heatmap."""
+        self.manager.db.submit("get_daily_totals", self.manager.current_user_id, year, month, callback=callback)
+    
     def update_date(self, selected_date):
         """Update date_input with the selected date and close popup"""
         self.ids.date_input.text = selected_date
@@ -508,6 +724,19 @@ class AddExpenseScreen(Screen):
         db = self.manager.db
 
         if amount and category:
+            try:
+                amount = float(amount)
+            except ValueError:
+                amount = math.nan
+            if not math.isfinite(amount):
+                self.show_popup("Error", "Please enter a valid amount!")
+                return
+            try:
+                repeat = self.repeat_rule()
+            except ValueError:
+                self.show_popup("Error", "Enter how many days apart the expense repeats!")
+                return
+
             try:
                 # Try to parse the date input (M/DD/YY format)
                 date_obj = datetime.strptime(date_input, "%m/%d/%y")
@@ -517,29 +746,47 @@ class AddExpenseScreen(Screen):
                 formatted_date = datetime.now().strftime("%Y-%m-%d")
                 self.show_popup("Date Format Error", "Invalid date format! Using today's date instead.")
 
-            db.add_expense(
-                self.manager.current_user_id,
-                formatted_date,
-                float(amount),
-                category,
-            )
-            
-            # Check if this expense pushed the user over their budget
-            exceeded, budget, expenses = db.check_budget_exceeded(self.manager.current_user_id)
-            if exceeded:
-                # Show budget alert popup before returning to home screen
-                budget_alert = BudgetAlertPopup(budget, expenses)
-                budget_alert.open()
-            
+            notes = self.ids.notes_input.text.strip()
+            if repeat:
+                # The rule's first occurrence is the entered date; the materializer writes it
+                # and any later ones already due
+                frequency, interval = repeat
+                db.submit(
+                    "add_recurring_expense",
+                    self.manager.current_user_id, formatted_date, amount, category,
+                    frequency, interval, notes,
+                    errback=self.on_save_failed,
+                )
+                db.submit("materialize_recurring")
+            else:
+                db.submit(
+                    "add_expense",
+                    self.manager.current_user_id,
+                    formatted_date,
+                    amount,
+                    category,
+                    notes,
+                    errback=self.on_save_failed,
+                )
+            self.category_index.add(category)
+
+            # Budget alerts the expense triggers show on the Home screen
             self.manager.transition = SlideTransition(direction='right')
             self.manager.current = "home"
         else:
             self.show_popup("Error", "Please fill in all fields!")
 
+    def on_save_failed(self, error):
+        """Tell the user the expense was not saved; the screen has already gone back to Home."""
+        Logger.warning(f"Database: saving an expense failed: {error}")
+        self.show_popup("Error", f"The expense was not saved:\n{error}")
+
+    @instrumented("screen")
     def on_pre_enter(self):
         """Set today's date as default when screen is shown."""
         today = datetime.now().strftime("%m/%d/%y")
         self.ids.date_input.text = today
+        self.load_categories()
 
     def back_to_home(self):
         """Return to the Home screen."""
@@ -553,57 +800,347 @@ class AddExpenseScreen(Screen):
 
 
 # 📊 --- View Expenses Screen ---
+class ExpenseRow(RecycleDataViewBehavior, BoxLayout):
+    """A single reusable row of the virtualized expense table."""
+
+    expense_id = NumericProperty(0)
+    date_text = StringProperty("")
+    amount_text = StringProperty("")
+    category_text = StringProperty("")
+    selected = BooleanProperty(False)
+    index = 0
+
+    def refresh_view_attrs(self, rv, index, data):
+        """Remember which data entry the recycled row is showing."""
+        self.index = index
+        return super(ExpenseRow, self).refresh_view_attrs(rv, index, data)
+
+    def select(self, active):
+        """Forward a checkbox tap to the View Expenses screen."""
+        # Also called when a recycled row is given another entry's selected flag
+        if active != self.selected:
+            self.selected = active
+            App.get_running_app().root.get_screen("view_expense").select_row(self.index, active)
+
+    def delete(self):
+        """Forward the Delete tap to the View Expenses screen."""
+        App.get_running_app().root.get_screen("view_expense").delete_expenses([self.expense_id])
+
+
 class ViewExpenseScreen(Screen):
     """Screen to display saved expenses in a tabular format."""
 
+    PAGE_SIZE = 50
+    start_date = None
+    end_date = None
+    next_cursor = None
+    loading = False
+    generation = 0
+    exporting = False
+    SEARCH_DELAY = 0.3
+    SEARCH_LIMIT = 200
+    ALL_PERIODS = "All months"
+    recurring_popup = None
+    UNDO_DEPTH = 10
+
+    def __init__(self, **kwargs):
+        super(ViewExpenseScreen, self).__init__(**kwargs)
+        # Restarted on every keystroke, so only a pause in typing runs a search
+        self.search_trigger = Clock.create_trigger(self.run_search, self.SEARCH_DELAY)
+        self.periods = {}  # jump-to spinner label -> (year, month)
+        self.selected_ids = set()
+        # (label, rows as they were, table changes, generation) of each undoable batch edit
+        self.undo_stack = deque(maxlen=self.UNDO_DEPTH)
+
+    @instrumented("screen")
     def on_enter(self):
         """Load expenses when this screen is entered."""
-        self.load_expenses()
+        self.load_periods()
+        if self.ids.search_input.text.strip():
+            self.run_search()
+        else:
+            self.load_expenses()
+
+    def load_periods(self):
+        """Fill the jump-to spinner with the months that have expenses."""
+        self.manager.db.submit(
+            "get_expense_periods", self.manager.current_user_id, callback=self.on_periods_loaded
+        )
+
+    def on_periods_loaded(self, periods):
+        """Label each month with its number of expenses, newest first."""
+        self.periods = {
+            f"{calendar.month_abbr[month]} {year} ({count})": (year, month)
+            for year, month, count, total in periods
+        }
+        self.ids.period_spinner.values = [self.ALL_PERIODS] + list(self.periods)
+
+    def jump_to_period(self, text):
+        """Show the expenses of the month picked in the spinner, or all of them."""
+        if text == self.ALL_PERIODS:
+            self.ids.start_date.text = self.ids.end_date.text = ""
+            start_date = end_date = None
+        elif text in self.periods:
+            year, month = self.periods[text]
+            last_day = calendar.monthrange(year, month)[1]
+            self.ids.start_date.text = f"01-{month:02d}-{year}"
+            self.ids.end_date.text = f"{last_day:02d}-{month:02d}-{year}"
+            start_date, end_date = f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last_day:02d}"
+        else:
+            return
+        if self.ids.search_input.text:
+            self.ids.search_input.text = ""
+            self.search_trigger.cancel()
+        self.load_expenses(start_date, end_date)
 
     def load_expenses(self, start_date=None, end_date=None):
-        """Load and display expenses in a table format with optional date filtering."""
-        # Reference to the table layout from the .kv file
-        expense_table = self.ids.expense_table
-        expense_table.clear_widgets()
+        """Load the first page of expenses into the virtualized table with optional date filtering."""
+        self.start_date = start_date
+        self.end_date = end_date
+        self.next_cursor = None
+        self.loading = False
+        # Pages requested for an earlier filter are dropped when they arrive
+        self.generation += 1
+        self.load_started = time.perf_counter()
+
+        # The RecycleView only creates widgets for the visible rows
+        self.ids.expense_table.data = []
+        self.clear_selection()
+        self.load_next_page(first_page=True)
+
+    def load_next_page(self, first_page=False):
+        """Append the next page of expenses to the table."""
+        if self.loading or (not first_page and not self.next_cursor):
+            return
+        self.loading = True
+
+        generation = self.generation
+        self.manager.db.submit(
+            "get_expenses_page",
+            self.manager.current_user_id, self.start_date, self.end_date, self.PAGE_SIZE, self.next_cursor,
+            callback=lambda page: self.on_page_loaded(page, generation),
+            errback=self.on_page_failed,
+        )
 
-        # Fetch data from the database
-        db = self.manager.db
-        user_id = self.manager.current_user_id
+    def on_page_loaded(self, page, generation):
+        """Append a page of expenses fetched by the database worker."""
+        if generation != self.generation:
+            return
+        self.loading = False
+        expenses, self.next_cursor = page
+
+        rows = self.ids.expense_table.data
+        instrumentation = App.get_running_app().instrumentation
+        if instrumentation and not rows:
+            # From the reload request to the first page being handed to the table
+            instrumentation.record(
+                "screen", "ViewExpenseScreen.load_expenses",
+                (time.perf_counter() - self.load_started) * 1000, rows=len(expenses),
+            )
+        rows.extend(self.expense_row(*expense) for expense in expenses)
+        self.ids.empty_label.text = "" if rows else "No expenses found!"
+
+    def on_page_failed(self, error):
+        """Allow the page to be requested again after a failed query."""
+        self.loading = False
+        self.show_popup("Error", f"Failed to load expenses: {error}")
+
+    def on_table_scroll(self, scroll_y):
+        """Load more expenses when the table is scrolled close to the bottom."""
+        if scroll_y <= 0.1:
+            self.load_next_page()
+
+    def expense_row(self, expense_id, date, amount, category):
+        """Build the data model entry for one row of the expense table."""
+        return {
+            "expense_id": expense_id,
+            "date_text": str(date),
+            "amount_text": f"₹{amount}",
+            "category_text": category,
+            "selected": False,
+        }
+
+    def reload_table(self):
+        """Query the table's rows again for the current search or date filter."""
+        if self.ids.search_input.text.strip():
+            self.run_search()
+        else:
+            self.load_expenses(self.start_date, self.end_date)
+
+    # --- Selection and batch edits ---
+    # The selected flag lives in the table's data so recycled rows show it; a batch edit
+    # changes the database in one transaction and patches only the affected data entries.
+    def select_row(self, index, selected):
+        """Mark one table entry as selected or not."""
+        row = self.ids.expense_table.data[index]
+        row["selected"] = selected
+        if selected:
+            self.selected_ids.add(row["expense_id"])
+        else:
+            self.selected_ids.discard(row["expense_id"])
+        self.update_batch_bar()
+
+    def select_all(self):
+        """Select every loaded row, or clear the selection if they all are."""
+        rows = self.ids.expense_table.data
+        selected = len(self.selected_ids) < len(rows)
+        for row in rows:
+            row["selected"] = selected
+        self.selected_ids = {row["expense_id"] for row in rows} if selected else set()
+        self.ids.expense_table.refresh_from_data()
+        self.update_batch_bar()
+
+    def clear_selection(self):
+        self.selected_ids = set()
+        self.update_batch_bar()
+
+    def update_batch_bar(self):
+        """Show the selection count and what Undo would undo."""
+        self.ids.selection_label.text = f"{len(self.selected_ids)} selected" if self.selected_ids else ""
+        self.ids.undo_button.disabled = not self.undo_stack
+        self.ids.undo_button.text = f"Undo {self.undo_stack[-1][0]}" if self.undo_stack else "Undo"
+
+    def delete_selected(self):
+        if not self.selected_ids:
+            self.show_popup("Error", "Select expenses first!")
+            return
+        self.delete_expenses(self.selected_ids)
+
+    def delete_expenses(self, expense_ids):
+        """Delete expenses in one transaction and drop only their rows from the table."""
+        expense_ids = set(expense_ids)
+        rows = self.ids.expense_table.data
+        removed = [(index, dict(row, selected=False)) for index, row in enumerate(rows) if row["expense_id"] in expense_ids]
+        # One assignment, so the table is refreshed once
+        self.ids.expense_table.data = [row for row in rows if row["expense_id"] not in expense_ids]
+        self.selected_ids -= expense_ids
+        if not self.ids.expense_table.data:
+            self.ids.empty_label.text = "No expenses found!"
+        self.run_batch("delete_expenses", expense_ids, f"delete of {len(expense_ids)}", ("removed", removed))
+
+    def edit_selected(self, label, method, change, *args):
+        """Apply change(row) to the selected table entries and method to their expenses."""
+        if not self.selected_ids:
+            self.show_popup("Error", "Select expenses first!")
+            return
+        rows = list(self.ids.expense_table.data)
+        changed = []
+        for index, row in enumerate(rows):
+            if row["expense_id"] in self.selected_ids:
+                new_row = change(row)
+                if new_row is not None:
+                    changed.append((index, dict(row, selected=False)))
+                    rows[index] = new_row
+        self.ids.expense_table.data = rows
+        self.run_batch(method, self.selected_ids, f"{label} of {len(self.selected_ids)}", ("changed", changed), *args)
+
+    def recategorize_selected(self, category):
+        """Move the selected expenses to another category."""
+        if not category.strip():
+            self.show_popup("Error", "Enter a category!")
+            return
+        name = normalize_category(category)
+        self.edit_selected("category change", "recategorize_expenses", lambda row: dict(row, category_text=name), category)
 
-        query = "SELECT id, date, amount, category FROM expenses WHERE user_id = ?"
-        params = [user_id]
+    def shift_selected(self, days_text):
+        """Move the selected expenses some days later, or earlier for a negative number."""
+        try:
+            days = int(days_text)
+        except ValueError:
+            self.show_popup("Error", "Enter a number of days, e.g. 7 or -1!")
+            return
+
+        def shifted(row):
+            new_date = shift_date(row["date_text"], days)
+            return dict(row, date_text=new_date) if new_date else None
+        self.edit_selected("date shift", "shift_expense_dates", shifted, days)
+
+    def run_batch(self, method, expense_ids, label, table_changes, *args):
+        """Submit a batch edit and make it undoable once it is written."""
+        generation = self.generation
+        self.manager.db.submit(
+            method, self.manager.current_user_id, sorted(expense_ids), *args,
+            callback=lambda before: self.on_batch_done(label, before, table_changes, generation),
+            errback=self.on_batch_failed,
+        )
+        self.update_batch_bar()
 
-        if start_date and end_date:
-            query += " AND date BETWEEN ? AND ?"
-            params.extend([start_date, end_date])
+    def on_batch_done(self, label, before, table_changes, generation):
+        self.undo_stack.append((label, before, table_changes, generation))
+        self.update_batch_bar()
+        self.load_periods()
 
-        query += " ORDER BY date DESC"
-        db.cursor.execute(query, tuple(params))
-        expenses = db.cursor.fetchall()
+    def on_batch_failed(self, error):
+        """Show the error and the table as it really is."""
+        self.show_popup("Error", f"Failed to update expenses: {error}")
+        self.reload_table()
 
-        # If no expenses found
-        if not expenses:
-            expense_table.add_widget(Label(text="No expenses found!", size_hint_y=None, height=40))
+    def undo(self):
+        """Reverse the last batch edit from its saved rows, without reading the table again."""
+        if not self.undo_stack:
             return
+        label, before, (kind, entries), generation = self.undo_stack.pop()
+        self.manager.db.submit(
+            "restore_expenses", self.manager.current_user_id, before,
+            callback=lambda restored: self.load_periods(), errback=self.on_batch_failed,
+        )
+        if generation != self.generation:
+            # The table was reloaded since the edit; the reload queues behind the restore
+            self.reload_table()
+        else:
+            rows = list(self.ids.expense_table.data)
+            for index, row in entries:
+                if kind == "removed":
+                    # Ascending indexes put each row back where it was
+                    rows.insert(index, row)
+                elif index < len(rows) and rows[index]["expense_id"] == row["expense_id"]:
+                    rows[index] = row
+                self.selected_ids.discard(row["expense_id"])
+            self.ids.expense_table.data = rows
+            self.ids.empty_label.text = "" if rows else "No expenses found!"
+        self.update_batch_bar()
+
+    def show_batch_popup(self, title, hint, action, input_filter=None):
+        """Ask for the value of a batch edit and pass it to action."""
+        content = BoxLayout(orientation='vertical')
+        value_input = TextInput(hint_text=hint, multiline=False, input_filter=input_filter)
+        apply_button = Button(text="Apply", size_hint=(1, 0.4))
+        content.add_widget(value_input)
+        content.add_widget(apply_button)
 
-        # Header row
-        headers = ['Date', 'Amount', 'Category', 'Action']
-        for header in headers:
-            expense_table.add_widget(Label(text=header, bold=True, color=(1, 1, 0, 1), size_hint_y=None, height=40))
-
-        # Populate table rows
-        for expense_id, date, amount, category in expenses:
-            expense_table.add_widget(Label(text=str(date), size_hint_y=None, height=30))
-            expense_table.add_widget(Label(text=f"₹{amount}", size_hint_y=None, height=30))
-            expense_table.add_widget(Label(text=category, size_hint_y=None, height=30))
-            # Action Button
-            delete_button = Button(text="Delete", on_release=lambda instance, x=expense_id: self.delete_expense(x))
-            expense_table.add_widget(delete_button)
-
-    def delete_expense(self, expense_id):
-        db = self.manager.db
-        db.delete_expense(expense_id)
-        self.load_expenses()
+        popup = Popup(title=title, content=content, size_hint=(0.8, 0.3))
+
+        def apply(*args):
+            popup.dismiss()
+            action(value_input.text)
+        apply_button.bind(on_release=apply)
+        popup.open()
+
+    def run_search(self, *args):
+        """Show the expenses matching the search box, or the date-filtered list when it is empty."""
+        text = self.ids.search_input.text.strip()
+        if not text:
+            self.load_expenses(self.start_date, self.end_date)
+            return
+
+        self.generation += 1
+        self.next_cursor = None
+        self.loading = True
+        generation = self.generation
+        self.manager.db.submit(
+            "search_expenses", self.manager.current_user_id, text, self.SEARCH_LIMIT,
+            callback=lambda expenses: self.on_search_results(expenses, generation),
+            errback=self.on_page_failed,
+        )
+
+    def on_search_results(self, expenses, generation):
+        """Replace the table with the search results, best matches first."""
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.ids.expense_table.data = [self.expense_row(*expense) for expense in expenses]
+        self.clear_selection()
+        self.ids.empty_label.text = "" if expenses else "No matching expenses!"
 
     def apply_filter(self):
         """Apply date filters to expenses."""
@@ -617,42 +1154,158 @@ class ViewExpenseScreen(Screen):
         except ValueError:
             self.show_popup("Error", "Date must be in DD-MM-YYYY format!")
 
+    def show_import_popup(self):
+        """Ask for a CSV file to import expenses from."""
+        content = BoxLayout(orientation='vertical')
+        path_input = TextInput(text="expenses_export.csv", multiline=False)
+        import_button = Button(text="Import", size_hint=(1, 0.3))
+
+        content.add_widget(Label(text="CSV file (Date,Amount,Category):"))
+        content.add_widget(path_input)
+        content.add_widget(import_button)
+
+        popup = Popup(title="Import Expenses", content=content, size_hint=(0.8, 0.4))
+
+        import_button.bind(on_release=lambda *args: self.import_from_csv(path_input.text, popup))
+        popup.open()
+
+    def show_recurring_popup(self):
+        """List the user's recurring expenses, each with a button that stops it."""
+        self.manager.db.submit(
+            "get_recurring_expenses", self.manager.current_user_id, callback=self.on_recurring_loaded
+        )
+
+    def on_recurring_loaded(self, rules):
+        """Fill the recurring expenses popup, opening it on first load."""
+        if self.recurring_popup is None:
+            self.recurring_popup = Popup(title="Recurring Expenses", size_hint=(0.9, 0.6))
+            self.recurring_popup.bind(on_dismiss=lambda *args: setattr(self, "recurring_popup", None))
+            self.recurring_popup.open()
+        content = BoxLayout(orientation="vertical", spacing=5)
+        rule_list = GridLayout(cols=1, spacing=5, size_hint_y=None)
+        rule_list.bind(minimum_height=rule_list.setter("height"))
+        scroll = ScrollView()
+        scroll.add_widget(rule_list)
+        content.add_widget(scroll)
+        if not rules:
+            rule_list.add_widget(Label(
+                text="No recurring expenses.\nChoose Repeat when adding an expense.", size_hint_y=None, height="60dp"
+            ))
+        for rule_id, amount, category, notes, frequency, interval, next_date, end_date in rules:
+            ended = end_date and next_date > end_date
+            row = BoxLayout(orientation="horizontal", size_hint_y=None, height="40dp")
+            row.add_widget(Label(
+                text=f"₹{amount:,.2f} {category}, {describe_recurrence(frequency, interval)}\n"
+                     f"{'ended' if ended else f'next {next_date}'}{f' until {end_date}' if end_date and not ended else ''}",
+                font_size="14sp",
+            ))
+            stop_button = Button(text="Stop", size_hint_x=0.25)
+            stop_button.bind(on_release=lambda *args, rule_id=rule_id: self.stop_recurring(rule_id))
+            row.add_widget(stop_button)
+            rule_list.add_widget(row)
+        close_button = Button(text="Close", size_hint_y=None, height="40dp")
+        close_button.bind(on_release=lambda *args: self.recurring_popup.dismiss())
+        content.add_widget(close_button)
+        self.recurring_popup.content = content
+
+    def stop_recurring(self, rule_id):
+        """Stop one rule and refresh the list; the expenses it already wrote stay."""
+        user_id = self.manager.current_user_id
+        self.manager.db.submit(
+            "delete_recurring_expense", user_id, rule_id,
+            callback=lambda deleted: self.show_recurring_popup(),
+            errback=lambda error: self.show_popup("Error", f"Failed to stop: {error}"),
+        )
+
+    def import_from_csv(self, path, popup):
+        """Bulk import expenses from a CSV file and report skipped rows."""
+        self.manager.db.submit(
+            "import_csv", self.manager.current_user_id, path,
+            callback=lambda result: self.on_import_finished(result, popup),
+            errback=lambda error: self.show_popup("Error", f"Failed to import: {error}"),
+        )
+
+    def on_import_finished(self, result, popup):
+        """Report imported and skipped rows, then reload the table."""
+        imported, errors = result
+        popup.dismiss()
+        message = f"Imported {imported} expenses."
+        if errors:
+            message += f"\nSkipped {len(errors)} rows:"
+            message += "".join(f"\nLine {line}: {error}" for line, error in errors[:5])
+        self.show_popup("Import", message)
+        self.load_expenses(self.start_date, self.end_date)
+
     def export_to_csv(self):
-        """Export filtered expenses to CSV file."""
-        try:
-            db = self.manager.db
-            user_id = self.manager.current_user_id
-            query = "SELECT date, amount, category FROM expenses WHERE user_id = ?"
-            db.cursor.execute(query, (user_id,))
-            expenses = db.cursor.fetchall()
-
-            if not expenses:
-                self.show_popup("Error", "No data to export!")
-                return
+        """Export the currently filtered expenses to a CSV file on a worker thread.
+        The export reads through its own connection, so the database worker stays free
+        for page loads and saves while a large history is written."""
+        if self.exporting:
+            return
+        self.exporting = True
 
-            with open("expenses_export.csv", "w", newline="") as file:
-                writer = csv.writer(file)
-                writer.writerow(["Date", "Amount", "Category"])
-                writer.writerows(expenses)
+        compress = self.ids.gzip_toggle.state == "down"
+        path = "expenses_export.csv.gz" if compress else "expenses_export.csv"
+        self.ids.status_label.text = "Exporting..."
 
-            self.show_popup("Success", "Expenses exported to CSV successfully!")
+        db = self.manager.db
+        threading.Thread(
+            target=self.run_export,
+            args=(db.path, db.profile, self.manager.current_user_id, path, self.start_date, self.end_date, compress),
+            name="export",
+            daemon=True,
+        ).start()
+
+    def run_export(self, db_path, profile, user_id, path, start_date, end_date, compress):
+        """Worker thread body: stream the export and report back through the Clock."""
+        try:
+            written = export_csv(
+                db_path, profile, user_id, path, start_date, end_date, compress,
+                progress=lambda count: Clock.schedule_once(lambda dt: self.show_export_progress(count)),
+            )
+            Clock.schedule_once(lambda dt: self.finish_export(path, written, None))
         except Exception as e:
-            self.show_popup("Error", f"Failed to export: {e}")
+            Clock.schedule_once(lambda dt, error=e: self.finish_export(path, 0, error))
+
+    def show_export_progress(self, count):
+        """Show how many rows the running export has written."""
+        if self.exporting:
+            self.ids.status_label.text = f"Exporting... {count} rows written"
+
+    def finish_export(self, path, written, error):
+        """Report the outcome of a finished export."""
+        self.exporting = False
+        self.ids.status_label.text = ""
+        if error:
+            self.show_popup("Error", f"Failed to export: {error}")
+        elif not written:
+            self.show_popup("Error", "No data to export!")
+        else:
+            self.show_popup("Success", f"Exported {written} expenses to {path}")
 
     def show_graph(self):
         """Display a category-wise expense graph."""
-        db = self.manager.db
-        user_id = self.manager.current_user_id
-        db.cursor.execute(
-            "SELECT category, SUM(amount) FROM expenses WHERE user_id = ? GROUP BY category",
-            (user_id,),
-        )
-        data = db.cursor.fetchall()
+        self.manager.db.submit("get_category_totals", self.manager.current_user_id, callback=self.plot_graph)
 
+    def plot_graph(self, data):
+        """Plot the category totals fetched by the database worker."""
         if not data:
             self.show_popup("Error", "No expenses to display!")
             return
 
+        if App.get_running_app().config.get("chart", "backend") == "matplotlib":
+            self.plot_with_matplotlib(data)
+            return
+
+        chart = CategoryChart(data=data)
+        popup = Popup(title="Category-wise Expense Breakdown", content=chart, size_hint=(0.95, 0.8))
+        popup.open()
+
+    def plot_with_matplotlib(self, data):
+        """Plot the category totals in a matplotlib window."""
+        # Imported on first use: matplotlib adds a lot of startup time and memory
+        import matplotlib.pyplot as plt
+
         categories = [row[0] for row in data]
         amounts = [row[1] for row in data]
 
@@ -679,35 +1332,38 @@ class ViewExpenseScreen(Screen):
 
 # Budget Alert Popup
 class BudgetAlertPopup(Popup):
-    def __init__(self, budget, expenses, **kwargs):
+    """Lists the alerts from get_unseen_alerts, most severe first."""
+
+    def __init__(self, alerts, **kwargs):
         super(BudgetAlertPopup, self).__init__(**kwargs)
         self.title = "Budget Alert!"
-        self.size_hint = (0.85, 0.4)
-        
-        # Calculate overspend amount and percentage
-        overspend = expenses - budget
-        percentage = (expenses / budget - 1) * 100 if budget > 0 else 0
+        self.size_hint = (0.85, 0.5)
         
+        exceeded = any(alert[3] >= 100 for alert in alerts)
         content = BoxLayout(orientation='vertical', spacing=10, padding=[20, 20])
         
-        # Alert message with red color
+        # Alert message, red once a budget is exceeded
         alert_message = Label(
-            text=f"[color=ff5555]You've exceeded your monthly budget![/color]",
+            text=("[color=ff5555]You've exceeded your budget![/color]" if exceeded
+                  else "[color=ffaa33]You're getting close to your budget.[/color]"),
             markup=True,
             font_size='18sp',
             size_hint_y=None,
             height='40dp'
         )
         
-        # Details 
+        # One line per budget
+        lines = []
+        for category, period, budget, threshold, spent, *_ in alerts:
+            name = f"{period.capitalize()} {category or 'overall'} budget"
+            if spent > budget:
+                lines.append(f"{name}: ₹{spent:.2f} of ₹{budget:.2f}, overspent by ₹{spent - budget:.2f}")
+            else:
+                lines.append(f"{name}: ₹{spent:.2f} of ₹{budget:.2f} ({threshold}% reached)")
         details = Label(
-            text=(f"Budget: ₹{budget:.2f}\n"
-                  f"Expenses: ₹{expenses:.2f}\n"
-                  f"Overspent: ₹{overspend:.2f} ({percentage:.1f}%)"),
+            text="\n".join(lines),
             halign='left',
             font_size='16sp',
-            size_hint_y=None,
-            height='80dp'
         )
         details.bind(size=details.setter('text_size'))
         
@@ -737,30 +1393,210 @@ class BudgetAlertPopup(Popup):
         self.content = content
 
 
+# 🗂️ --- Screen Manager ---
+class LazyScreenManager(ScreenManager):
+    """ScreenManager that builds a registered screen the first time it is needed."""
+
+    def __init__(self, **kwargs):
+        super(LazyScreenManager, self).__init__(**kwargs)
+        self.screen_factories = {}
+
+    def register(self, name, factory):
+        """Register a screen class to be built on first navigation."""
+        self.screen_factories[name] = factory
+
+    def get_screen(self, name):
+        factory = self.screen_factories.pop(name, None)
+        if factory:
+            instrumentation = App.get_running_app().instrumentation
+            start = time.perf_counter()
+            self.add_widget(factory(name=name))
+            if instrumentation:
+                instrumentation.record("screen", f"build {name}", (time.perf_counter() - start) * 1000)
+        return super(LazyScreenManager, self).get_screen(name)
+
+
+# 🐞 --- Debug Screen ---
+class DebugScreen(Screen):
+    """Hidden screen with the instrumentation summary, opened by tapping the home title."""
+
+    def on_enter(self):
+        self.refresh()
+
+    def refresh(self):
+        """Show frame times and the slowest operations recorded so far."""
+        summary = App.get_running_app().instrumentation.summary()
+        frames = summary["frames"]
+        lines = [
+            f"Frames: {frames['count']}  p50 {frames['p50_ms']:.1f} ms  "
+            f"p95 {frames['p95_ms']:.1f} ms  max {frames['max_ms']:.1f} ms",
+            "",
+            f"{'operation':<40} {'n':>5} {'mean':>8} {'p95':>8} {'max':>8}",
+        ]
+        for operation in summary["operations"][:40]:
+            name = f"{operation['kind']} {operation['name']}"[:40]
+            lines.append(
+                f"{name:<40} {operation['count']:>5} {operation['mean_ms']:>8.1f} "
+                f"{operation['p95_ms']:>8.1f} {operation['max_ms']:>8.1f}"
+            )
+        self.ids.summary_label.text = "\n".join(lines)
+
+    def dump(self):
+        """Write the recorded events to the configured JSON file."""
+        app = App.get_running_app()
+        path = app.config.get("debug", "dump_path")
+        try:
+            app.instrumentation.dump(path)
+            self.show_popup("Saved", f"Instrumentation written to\n{path}")
+        except OSError as e:
+            self.show_popup("Error", f"Failed to write {path}: {e}")
+
+    def back_to_home(self):
+        self.manager.transition = SlideTransition(direction='right')
+        self.manager.current = "home"
+
+    def show_popup(self, title, message):
+        """Reusable popup handler."""
+        popup = Popup(title=title, content=Label(text=message), size_hint=(None, None), size=(400, 200))
+        popup.open()
+
+
 # 🚀 --- App Setup ---
 class KharchaBookApp(App):
+    def build_config(self, config):
+        config.setdefaults("storage", {"pragma_profile": "fast"})
+        config.setdefaults("chart", {"backend": "kivy"})
+        config.setdefaults("startup", {"splash_min_seconds": 1.0})
+        config.setdefaults("cache", {"max_kb": 2048})
+        # Shade the date picker's days by how much was spent on them
+        config.setdefaults("calendar", {"heatmap": 1})
+        # Address of a sync_server.py instance, e.g. http://192.168.1.10:8765; empty disables sync
+        config.setdefaults("sync", {"url": ""})
+        # Gzipped copies of the database written in the background; interval_hours 0 disables them
+        config.setdefaults("backup", {"dir": "backups", "keep": 7, "interval_hours": 24, "pages_per_step": 256})
+        # Opt-in timing of database calls, screens and frames; see the hidden debug screen
+        config.setdefaults("debug", {
+            "instrumentation": 0,
+            "slow_ms": 50,
+            "buffer_size": 2000,
+            "dump_path": "instrumentation.json",
+        })
+
+    instrumentation = None
+
     def build(self):
-        db = Database()
+        self.startup_phases = []
+        self.mark_startup("imports")
+        if self.config.getboolean("debug", "instrumentation"):
+            self.instrumentation = Instrumentation(
+                capacity=self.config.getint("debug", "buffer_size"),
+                slow_ms=self.config.getfloat("debug", "slow_ms"),
+                log=Logger.warning,
+            )
+            # Called every frame with the time since the previous one
+            Clock.schedule_interval(self.instrumentation.frame, 0)
+        db = DatabaseWorker(
+            profile=self.config.get("storage", "pragma_profile"),
+            dispatch=lambda fn: Clock.schedule_once(lambda dt: fn()),
+            cache_bytes=self.config.getint("cache", "max_kb") * 1024,
+            instrumentation=self.instrumentation,
+            on_error=self.on_database_error,
+        )
         # Remove default transition direction from ScreenManager initialization
-        sm = ScreenManager()
+        sm = LazyScreenManager()
         sm.db = db
         sm.current_user_id = None
 
-        sm.add_widget(WelcomeScreen(name="welcome"))
-        sm.add_widget(LoginScreen(name="login"))
-        sm.add_widget(RegisterScreen(name="register"))
-        sm.add_widget(HomeScreen(name="home"))
-        sm.add_widget(AddExpenseScreen(name="add_expense"))
-        sm.add_widget(ViewExpenseScreen(name="view_expense"))
+        # Only the splash is built now; the other screens are built on first visit
+        welcome = WelcomeScreen(name="welcome")
+        sm.add_widget(welcome)
+        sm.register("login", LoginScreen)
+        sm.register("register", RegisterScreen)
+        sm.register("home", HomeScreen)
+        sm.register("add_expense", AddExpenseScreen)
+        sm.register("view_expense", ViewExpenseScreen)
+        if self.instrumentation:
+            sm.register("debug", DebugScreen)
 
         sm.current = "welcome"
-        
+
+        # Queued first, so this completes as soon as the database is open and migrated
+        db.submit(lambda database: None, callback=welcome.on_database_ready, errback=welcome.on_database_failed)
+        # Catch up recurring expenses that fell due since the app last ran
+        db.submit("materialize_recurring")
+        db.submit(lambda database: None, callback=lambda result: self.backup_if_due())
+        self.mark_startup("build")
         return sm
-        
+
     def on_start(self):
         # Set dark mode as default for app background
         # This is called after the window is created
         self.root_window.clearcolor = (0, 0, 0, 1)
+        self.mark_startup("window ready")
+        # Build the login screen after the splash has had a chance to draw
+        Clock.schedule_once(self.prepare_login)
+
+    def prepare_login(self, dt):
+        self.root.get_screen("login")
+        self.root.get_screen("welcome").on_login_ready()
+
+    def mark_startup(self, phase):
+        """Record the time a startup phase finished."""
+        self.startup_phases.append((phase, time.perf_counter()))
+
+    def log_startup(self):
+        """Log how long each startup phase took."""
+        previous = STARTED_AT
+        parts = []
+        for phase, finished_at in self.startup_phases:
+            parts.append(f"{phase} {(finished_at - previous) * 1000:.0f} ms")
+            previous = finished_at
+        total = (previous - STARTED_AT) * 1000
+        Logger.info(f"Startup: {', '.join(parts)} (total {total:.0f} ms)")
+
+    def on_database_error(self, name, error):
+        """Report a failed database call that no screen handles, e.g. a background write."""
+        Logger.warning(f"Database: {name} failed: {error}")
+        if self.root.get_screen("welcome").database_error:
+            # Every call fails the same way once opening it did, and that was shown already
+            return
+        Popup(
+            title="Database Error", content=Label(text=f"{name} failed:\n{error}"), size_hint=(None, None), size=(400, 200)
+        ).open()
+
+    def backup_if_due(self):
+        """Start a background backup when the newest one is older than [backup] interval_hours.
+        It reads through its own connection, so saving expenses does not wait for it."""
+        hours = self.config.getfloat("backup", "interval_hours")
+        directory = self.config.get("backup", "dir")
+        age = backup_age(directory)
+        if hours <= 0 or (age is not None and age < hours * 3600):
+            return
+        self.backup_started = time.perf_counter()
+        start_backup(
+            self.root.db.path,
+            directory,
+            keep=self.config.getint("backup", "keep"),
+            pages_per_step=self.config.getint("backup", "pages_per_step"),
+            callback=lambda result, error: Clock.schedule_once(lambda dt: self.on_backup_finished(result, error)),
+        )
+
+    def on_backup_finished(self, result, error):
+        """Log the outcome of a background backup."""
+        if error:
+            Logger.warning(f"Backup: failed: {error}")
+            return
+        path, pages, steps, restarts = result
+        elapsed = (time.perf_counter() - self.backup_started) * 1000
+        Logger.info(f"Backup: wrote {path}, {pages} pages in {steps} steps ({elapsed:.0f} ms)")
+        if self.instrumentation:
+            self.instrumentation.record("backup", "backup_database", elapsed, pages=pages, restarts=restarts)
+
+    def on_stop(self):
+        # Let queued writes finish before the connection closes
+        self.root.db.close()
+        if self.instrumentation:
+            self.instrumentation.dump(self.config.get("debug", "dump_path"))
 
 if __name__ == "__main__":
     KharchaBookApp().run()
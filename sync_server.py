@@ -0,0 +1,146 @@
+"""Small HTTP/JSON server that lets several KharchaBook devices share their expenses.
+
+Each device POSTs to /sync a gzipped JSON object
+
+    {"user": USERNAME, "device": DEVICE_ID, "since": SEQ, "limit": N,
+     "changes": [[uuid, date, amount, category, notes, updated_at, deleted], ...]}
+
+holding its own changes since the last sync. The server keeps the newest version of
+every row (last writer wins, by updated_at and then device id) and numbers each
+accepted change with a sequence number. The gzipped JSON reply
+
+    {"seq": SEQ, "more": BOOL,
+     "changes": [[uuid, date, amount, category, notes, updated_at, device, deleted], ...]}
+
+carries up to N changes made by other devices after since, plus the winning version
+of any pushed change that lost. There is no authentication: run it on a trusted network.
+
+    python sync_server.py [--host 0.0.0.0] [--port 8765] [--db sync.db]
+"""
+import argparse
+import gzip
+import json
+import sqlite3
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class SyncStore:
+    """The server's copy of every user's expenses and deletions."""
+
+    def __init__(self, path="sync.db"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS changes (
+                user TEXT NOT NULL,
+                uuid TEXT NOT NULL,
+                date TEXT,
+                amount REAL,
+                category TEXT,
+                notes TEXT,
+                updated_at INTEGER NOT NULL,
+                device TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (user, uuid))"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_changes_user_seq ON changes (user, seq)")
+        self.conn.commit()
+        self.seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def sync(self, user, device, since, changes, limit=500):
+        """Merge a device's changes and return the reply described in the module docstring."""
+        lost = []
+        with self.conn:
+            for uuid, date, amount, category, notes, updated_at, deleted in changes:
+                current = self.conn.execute(
+                    """SELECT uuid, date, amount, category, notes, updated_at, device, deleted
+                    FROM changes WHERE user = ? AND uuid = ?""",
+                    (user, uuid),
+                ).fetchone()
+                if current and (current[5], current[6]) >= (updated_at, device):
+                    if (current[5], current[6]) != (updated_at, device):
+                        lost.append(list(current))
+                    continue
+                self.seq += 1
+                self.conn.execute(
+                    "REPLACE INTO changes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user, uuid, date, amount, category, notes, updated_at, device, int(bool(deleted)), self.seq),
+                )
+
+        # The device already has its own changes, so only the other devices' are sent
+        rows = self.conn.execute(
+            """SELECT uuid, date, amount, category, notes, updated_at, device, deleted, seq
+            FROM changes WHERE user = ? AND seq > ? AND device != ? ORDER BY seq LIMIT ?""",
+            (user, since, device, limit),
+        ).fetchall()
+        more = len(rows) == limit
+        return {
+            "seq": rows[-1][8] if more else self.seq,
+            "more": more,
+            "changes": lost + [list(row[:8]) for row in rows],
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/sync":
+            self.send_error(404)
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            request = json.loads(body)
+            reply = self.server.store.sync(
+                request["user"], request["device"], int(request.get("since", 0)),
+                request.get("changes", []), min(int(request.get("limit", 500)), 5000),
+            )
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self.send_error(400, str(e))
+            return
+
+        payload = gzip.compress(json.dumps(reply, separators=(",", ":")).encode("utf-8"))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="0.0.0.0", port=8765, path="sync.db", verbose=False):
+    """Create the HTTP server; port 0 picks a free port (see server.server_port)."""
+    server = HTTPServer((host, port), SyncRequestHandler)
+    server.store = SyncStore(path)
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KharchaBook sync server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="sync.db", help="server database file (default: sync.db)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.db, verbose=True)
+    print(f"Serving sync on http://{args.host}:{server.server_port}/sync")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
+
+
+if __name__ == "__main__":
+    main()